@@ -0,0 +1,116 @@
+import hashlib, json, os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cancel import sessionToken
+from .imaging import ImageOptimizer, isImage, optimizeImage
+from .media import MEDIA_FORMATS, downloadFile
+
+# downloads that failed this often are given up on
+MAX_ATTEMPTS = 3
+
+# media of notes that were added text first, one entry per field that still
+# waits for its file: the note id, the field and the url; the queue is kept
+# next to the add-on per collection, so it survives a restart of Anki
+class BackfillQueue:
+
+    def __init__(self, path, col_path):
+        key = hashlib.sha1(os.path.abspath(col_path).encode("utf-8")).hexdigest()
+        self.path = os.path.join(path, key + ".json")
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    # the import and the backfill both save it, from different threads
+    def save(self):
+        with self.lock:
+            if not self.entries:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+                return
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def add(self, nid, field, url):
+        with self.lock:
+            self.entries.append({"nid": nid, "field": field, "url": url, "attempts": 0})
+
+    def batch(self, size):
+        with self.lock:
+            return self.entries[:size]
+
+    # drop the entries that are done, the failed ones go to the back of the
+    # queue until they ran out of attempts
+    def finish(self, entries, failed=()):
+        with self.lock:
+            done = set(map(id, entries))
+            self.entries = [e for e in self.entries if id(e) not in done]
+            for entry in failed:
+                entry["attempts"] += 1
+                if entry["attempts"] < MAX_ATTEMPTS:
+                    self.entries.append(entry)
+        self.save()
+
+# download the files of a batch, runs in a worker thread so it must not touch
+# the collection; returns url -> (file name, content or None), stopping the
+# backfill cancels the token of its session
+def downloadBatch(session, entries, config, media_cache=None):
+    urls = list(dict.fromkeys(entry["url"] for entry in entries))
+    optimize = ImageOptimizer.enabled(config)
+
+    def download(url):
+        file_name, data = downloadFile(session, url, media_cache)
+        if optimize and data is not None and isImage(file_name):
+            file_name, data = optimizeImage(file_name, data, config["image_max_size"],
+                                            config["image_format"], config["image_quality"])
+        return file_name, data
+
+    token = sessionToken(session)
+    executor = ThreadPoolExecutor(max_workers=max(1, config["media_workers"]))
+    try:
+        futures = [executor.submit(download, url) for url in urls]
+        return dict(zip(urls, [token.result(future) for future in futures]))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# write the downloaded files and fill them into the notes; the batches share
+# an undo entry of their own while nothing else happens in between, skipping
+# the undo entry would clear the undo queue of the import and of the user;
+# returns the changes and the entries whose download failed
+def applyBatch(col, entries, files, undo_entry=None):
+    media_files = {}
+    for url, (file_name, data) in files.items():
+        if data is not None:
+            media_files[url] = col.media.write_data(file_name, data)
+
+    notes = {}
+    failed = []
+    for entry in entries:
+        file_name = media_files.get(entry["url"])
+        if not file_name:
+            failed.append(entry)
+            continue
+        if entry["nid"] not in notes:
+            try:
+                notes[entry["nid"]] = col.get_note(entry["nid"])
+            except Exception:
+                # the note was deleted in the meantime
+                continue
+        note = notes[entry["nid"]]
+        if entry["field"] in note:
+            note[entry["field"]] = MEDIA_FORMATS[entry["field"]].format(file_name)
+    if undo_entry is None:
+        undo_entry = []
+    if not undo_entry or col.undo_status().last_step != undo_entry[0]:
+        undo_entry[:] = [col.add_custom_undo_entry("Download Quizlet Media")]
+    col.update_notes(list(notes.values()))
+    return col.merge_undo_entries(undo_entry[0]), failed
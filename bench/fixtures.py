@@ -0,0 +1,99 @@
+# Synthetic Quizlet payloads for the benchmarks, shaped like the parts of the
+# real pages the importer reads. Everything is generated from the set ID and
+# term index, so a run with the same sizes always sees the same data.
+
+import json
+
+# number of terms embedded in a set page, larger sets are paged
+SET_PAGE_TERMS = 500
+
+# a 1x1 png and a few bytes that pass for an mp3
+IMAGE_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+AUDIO_BYTES = b"ID3\x03\x00\x00\x00\x00\x00\x0f" + b"\xff\xfb\x90\x64" * 256
+
+def richText(text, i):
+    marks = [{"type": "b"}]
+    if i % 3 == 0:
+        marks.append({"type": "i"})
+    if i % 5 == 0:
+        marks.append({"type": "bgY", "attrs": {"class": "bgY"}})
+    return {"type": "doc", "content": [
+        {"type": "paragraph", "content": [
+            {"type": "text", "text": text, "marks": marks},
+            {"type": "text", "text": " plain tail"},
+        ]},
+        {"type": "paragraph"},
+    ]}
+
+def studiableItem(base, setId, i, media=True):
+    word = "word {} of set {}".format(i, setId)
+    definition = "definition {} *with* some\nlonger text".format(i)
+    item = {
+        "id": setId * 1000000 + i,
+        "cardSides": [
+            {"label": "word", "media": [{
+                "type": 1,
+                "plainText": word,
+                "ttsUrl": "{}/tts/en.mp3?v=14&b=w{}x{}&s=w{}x{}".format(base, setId, i, setId, i),
+                "richText": richText(word, i),
+            }]},
+            {"label": "definition", "media": [{
+                "type": 1,
+                "plainText": definition,
+                "ttsUrl": "{}/tts/en.mp3?v=14&b=d{}x{}&s=d{}x{}".format(base, setId, i, setId, i),
+                "richText": richText(definition, i + 1),
+            }]},
+        ],
+    }
+    if media and i % 2 == 0:
+        item["cardSides"][1]["media"].append({
+            "type": 2,
+            "url": "{}/img/{}x{}_m.png".format(base, setId, i),
+        })
+    return item
+
+def nextDataPage(title, page_props):
+    next_data = {"props": {"pageProps": page_props}, "page": "/[setId]/flashcards"}
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        "<title>{} Flashcards | Quizlet</title></head><body>"
+        "<div id=\"__next\">{}</div>"
+        "<script id=\"__NEXT_DATA__\" type=\"application/json\">{}</script>"
+        "</body></html>"
+    ).format(title, "<div class=\"pad\"></div>" * 2000, json.dumps(next_data)).encode("utf-8")
+
+def setPage(base, setId, total):
+    embedded = min(total, SET_PAGE_TERMS)
+    state = {
+        "setPage": {
+            "pagingMeta": {"total": total, "perPage": SET_PAGE_TERMS, "token": "token{}".format(setId)},
+        },
+        "studyModesCommon": {
+            "studiableData": {
+                "studiableItems": [studiableItem(base, setId, i) for i in range(embedded)],
+            },
+        },
+        "set": {"id": setId, "title": "Benchmark set {}".format(setId)},
+    }
+    return nextDataPage("Benchmark set {}".format(setId), {"dehydratedReduxStateKey": json.dumps(state)})
+
+def itemsPage(base, setId, total, page, perPage):
+    start = (page - 1) * perPage
+    items = [studiableItem(base, setId, i) for i in range(start, min(total, start + perPage))]
+    paging = {"total": total, "page": page, "perPage": perPage, "token": "token{}".format(setId)}
+    return json.dumps({"responses": [{"models": {"studiableItem": items}, "paging": paging}]}).encode("utf-8")
+
+def setJson(setId):
+    return json.dumps({"responses": [{"models": {"set": [{"id": setId, "title": "Benchmark set {}".format(setId)}]}}]}).encode("utf-8")
+
+def folderPage(base, folderId, sets):
+    models = {
+        "folder": [{"id": folderId, "name": "Benchmark folder {}".format(folderId)}],
+        "set": [{"id": setId, "_webUrl": "{}/{}/benchmark-set-{}/".format(base, setId, setId)}
+                for setId, total in sets],
+        "folderStudyMaterial": [{"setId": setId} for setId, total in sets],
+    }
+    return nextDataPage("Benchmark folder {}".format(folderId), {"models": models})
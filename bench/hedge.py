@@ -0,0 +1,106 @@
+# Media request policy benchmark.
+#
+# Downloads the images of a synthetic set from the stand-in server while a
+# share of the responses stall or fail with a 503, with plain GETs, with
+# retries only and with retries and hedged requests, on both engines:
+#
+#   python bench/hedge.py
+#   python bench/hedge.py --files 2000 --slow 0.02 --errors 0.05 --stall 5
+
+import argparse, importlib, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+# the engine and the policy use relative imports, so load the add-on as a package
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+addon = os.path.basename(ADDON_DIR)
+engine = importlib.import_module(addon + ".engine")
+media = importlib.import_module(addon + ".media")
+network = importlib.import_module(addon + ".network")
+stats = importlib.import_module(addon + ".stats")
+
+from server import StandInServer
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+def run(config, urls, mode):
+    run_stats = stats.ImportStats()
+    if mode == "plain":
+        session = stats.InstrumentedSession(network.createSession(config), run_stats)
+    else:
+        session = engine.openSession(dict(config, hedge_requests=(mode == "hedged")), stats=run_stats)
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+
+    def download(url):
+        t = time.perf_counter()
+        try:
+            file_name, data = media.downloadFile(session, url)
+        except Exception:
+            data = None
+        latencies.append(time.perf_counter() - t)
+        return data
+
+    async def downloadAsync(url):
+        t = time.perf_counter()
+        file_name, data = await session.downloadFile(url)
+        latencies.append(time.perf_counter() - t)
+        return data
+
+    if isinstance(session, engine.AsyncEngine):
+        results = [future.result() for future in [session.submit(downloadAsync(url)) for url in urls]]
+    else:
+        with ThreadPoolExecutor(max_workers=config["media_workers"]) as executor:
+            results = list(executor.map(download, urls))
+    failed = sum(1 for data in results if data is None)
+    seconds = time.perf_counter() - start
+    session.close()
+    counters = run_stats.counters
+    return {
+        "seconds": seconds,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "failed": failed,
+        "retries": counters.get("media retries", 0),
+        "hedged": counters.get("hedged requests", 0),
+        "won": counters.get("hedges won", 0),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Media request policy benchmark")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--slow", type=float, default=0.02, help="share of media responses that stall")
+    parser.add_argument("--errors", type=float, default=0.02, help="share of media responses that fail with a 503")
+    parser.add_argument("--stall", type=float, default=3.0, help="seconds a slow media response takes")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+
+    results = {}
+    print("{:>8} {:>8} {:>8} {:>7} {:>7} {:>7} {:>8} {:>7} {:>5}".format(
+        "engine", "mode", "seconds", "p50", "p99", "failed", "retries", "hedged", "won"))
+    for engine_name in ("threads", "async"):
+        for mode in ("plain", "retries", "hedged"):
+            if engine_name == "async" and mode == "plain":
+                continue
+            # a fresh server per run, so every run sees the same faults
+            server = StandInServer(latency=args.latency, slow=args.slow, errors=args.errors, stall=args.stall).start()
+            urls = ["{}/img/{}.png".format(server.base, i) for i in range(args.files)]
+            r = run(dict(config, engine=engine_name), urls, mode)
+            server.shutdown()
+            results["{} {}".format(engine_name, mode)] = r
+            print("{:>8} {:>8} {:>8.2f} {:>6.3f}s {:>6.3f}s {:>7} {:>8} {:>7} {:>5}".format(
+                engine_name, mode, r["seconds"], r["p50"], r["p99"], r["failed"], r["retries"], r["hedged"], r["won"]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,92 @@
+# Record a real Quizlet set for offline benchmarks.
+#
+#   python bench/record.py --out fixtures 160732581 [more set IDs] [--qlts COOKIE]
+#   python bench/run.py --fixtures fixtures --sets 160732581
+#
+# The set page, its item pages and its images and TTS files are downloaded
+# through the add-on's own code and stored so that server.py can replay them.
+# Quizlet hosts in the payloads are replaced with a placeholder for the
+# stand-in server's address.
+
+import argparse, importlib, os, sys, urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+# the network code uses relative imports, so load the add-on as a package
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+addon = os.path.basename(ADDON_DIR)
+extract = importlib.import_module(addon + ".extract")
+media = importlib.import_module(addon + ".media")
+network = importlib.import_module(addon + ".network")
+terms = importlib.import_module(addon + ".terms")
+
+from server import BASE_PLACEHOLDER, fixtureName
+
+HOSTS = [
+    (b"https://o.quizlet.com", BASE_PLACEHOLDER + b"/o"),
+    (b"https:\\/\\/o.quizlet.com", BASE_PLACEHOLDER + b"\\/o"),
+    (b"https://quizlet.com", BASE_PLACEHOLDER),
+    (b"https:\\/\\/quizlet.com", BASE_PLACEHOLDER),
+]
+
+# the path the stand-in server will be asked for when replaying a url
+def replayPath(url):
+    url = urllib.parse.urlparse(url)
+    path = url.path + ("?" + url.query if url.query else "")
+    if url.netloc == "o.quizlet.com":
+        path = "/o" + path
+    return path
+
+# session that stores every successful response on the way
+class RecordingSession:
+
+    def __init__(self, session, out):
+        self.session = session
+        self.out = out
+
+    def get(self, url, **kwargs):
+        r = self.session.get(url, **kwargs)
+        if r.status_code == 200 and urllib.parse.urlparse(url).netloc.endswith("quizlet.com"):
+            body = r.content
+            for host, placeholder in HOSTS:
+                body = body.replace(host, placeholder)
+            with open(os.path.join(self.out, fixtureName(replayPath(url))), "wb") as f:
+                f.write(body)
+        return r
+
+    def close(self):
+        self.session.close()
+
+def record(session, limiter, sid):
+    body = network.fetchPage(session, limiter, network.setPageUrl(sid))
+    result = extract.extractSetData(body, network.setPageUrl(sid))
+    meta = result.get("setPage", {}).get("pagingMeta")
+    if meta and meta["total"] > meta["perPage"]:
+        pages = network.fetchItemPages(session, limiter, meta, sid)
+    else:
+        pages = [result["studyModesCommon"]["studiableData"]["studiableItems"]]
+    count = 0
+    for page in terms.iterTermPages(pages):
+        for term in page:
+            for url in (term.imageUrl, term.wordTTS, term.definitionTTS):
+                if url:
+                    media.downloadFile(session, url)
+            count += 1
+    print("{}: {} terms".format(sid, count))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record Quizlet sets for the offline benchmark")
+    parser.add_argument("sets", nargs="+", type=int)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--qlts", help="qlts cookie for private sets")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    config = {"connect_timeout": 10, "http_timeout": 30, "max_connections": 16}
+    session = RecordingSession(network.createSession(config, {"qlts": args.qlts} if args.qlts else None), args.out)
+    limiter = network.RateLimiter(1)
+    for sid in args.sets:
+        record(session, limiter, sid)
+    session.close()
@@ -0,0 +1,143 @@
+# Rich text renderer benchmark and golden check.
+#
+# Renders heavily formatted synthetic terms with richtext.py and compares
+# every result with the recursive getText the importer used before, which is
+# kept below as the reference. Exits with 1 when any output differs.
+#
+#   python bench/render.py
+#   python bench/render.py --terms 50000 --page 100
+
+import argparse, os, random, re, sys, time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, ADDON_DIR)
+
+import richtext
+from richtext import rich_text_css_dark_background_colors, rich_text_css_light_background_colors
+
+# the renderer as it was in importer.py, the golden output
+def getText(d, text=''):
+    if not d:
+        return text
+    if d['type'] == 'text':
+        text = d['text']
+        if 'marks' in d:
+            for m in d['marks']:
+                if m['type'] in ['b', 'i', 'u']:
+                    text = '<{0}>{1}</{0}>'.format(m['type'], text)
+                if 'attrs' in m:
+                    attrs = " ".join(['{}="{}"'.format(k, v) for k, v in m['attrs'].items()])
+                    if "class" in m['attrs']:
+                        light_color = rich_text_css_light_background_colors.get(m['attrs']['class'], '')
+                        dark_color = rich_text_css_dark_background_colors.get(m['attrs']['class'], '')
+                    else:
+                        light_color = ''
+                        dark_color = ''
+                    if light_color:
+                        text = '<span {} style="background-color: light-dark({}, {});">{}</span>'.format(attrs, light_color, dark_color, text)
+                    else:
+                        text = '<span {}>{}</span>'.format(attrs, text)
+        return text
+    text = ''.join([getText(c) if c else '<br>' for c in d.get('content', [''])])
+    if d['type'] == 'paragraph':
+        text = '<div>{}</div>'.format(text)
+    return text
+
+def ankify(text):
+    text = text.replace('\n','<br>')
+    text = re.sub(r'\*(.+?)\*', r'<b>\1</b>', text)
+    return text
+
+MARKS = [
+    {"type": "b"},
+    {"type": "i"},
+    {"type": "u"},
+    {"type": "bgY", "attrs": {"class": "bgY"}},
+    {"type": "bgB", "attrs": {"class": "bgB"}},
+    {"type": "bgP", "attrs": {"class": "bgP"}},
+    {"type": "color", "attrs": {"class": "unknown"}},
+    {"type": "link", "attrs": {"href": "https://example.com", "target": "_blank"}},
+    {"type": "b", "attrs": {"class": "bgY"}},
+]
+
+# a term side with several paragraphs of differently marked text, empty
+# paragraphs, missing children and bare nodes without content
+def richDoc(rng, words):
+    paragraphs = []
+    for p in range(rng.randint(1, 4)):
+        content = []
+        for n in range(rng.randint(1, 6)):
+            node = {"type": "text", "text": " ".join(rng.choice(words) for w in range(rng.randint(1, 5)))}
+            if rng.random() < 0.8:
+                node["marks"] = rng.sample(MARKS, rng.randint(1, 4))
+            content.append(node)
+            if rng.random() < 0.1:
+                content.append(None)
+        paragraphs.append({"type": "paragraph", "content": content})
+        if rng.random() < 0.2:
+            paragraphs.append({"type": "paragraph"})
+        if rng.random() < 0.1:
+            paragraphs.append({"type": "hardBreak", "content": []})
+    return {"type": "doc", "content": paragraphs}
+
+def makeSides(count, seed=1):
+    rng = random.Random(seed)
+    words = ["term", "*bold*", "définition", "<tag>", "x\ny", "漢字", "a & b", "long" * 5]
+    sides = []
+    for i in range(count * 2):
+        plain = " ".join(rng.choice(words) for w in range(6))
+        rich = richDoc(rng, words) if rng.random() < 0.95 else ""
+        sides.append((rich, plain))
+    return sides
+
+def best(func, repeat):
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rich text renderer benchmark")
+    parser.add_argument("--terms", type=int, default=10000)
+    parser.add_argument("--page", type=int, default=100, help="terms rendered per batch")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sides = makeSides(args.terms)
+
+    # golden check, single documents and batches
+    expected = [getText(rich, ankify(plain)) for rich, plain in sides]
+    single = [richtext.renderRichText(rich, richtext.ankify(plain)) for rich, plain in sides]
+    batched = []
+    step = args.page * 2
+    for start in range(0, len(sides), step):
+        batched.extend(richtext.renderMany((rich, richtext.ankify(plain)) for rich, plain in sides[start:start + step]))
+    for name, output in (("single", single), ("batched", batched)):
+        for i, (want, got) in enumerate(zip(expected, output)):
+            if want != got:
+                print("{} output differs for side {}:\n  expected {!r}\n  got      {!r}".format(name, i, want, got))
+                sys.exit(1)
+        assert len(output) == len(expected)
+    print("golden check: {} sides match".format(len(expected)))
+
+    def reference():
+        for rich, plain in sides:
+            getText(rich, ankify(plain))
+
+    def renderSingle():
+        for rich, plain in sides:
+            richtext.renderRichText(rich, richtext.ankify(plain))
+
+    def renderBatched():
+        for start in range(0, len(sides), step):
+            richtext.renderMany((rich, richtext.ankify(plain)) for rich, plain in sides[start:start + step])
+
+    base = best(reference, args.repeat)
+    print("{:>10} {:>10} {:>12} {:>8}".format("renderer", "seconds", "terms/s", "speedup"))
+    for name, func in (("getText", reference), ("single", renderSingle), ("batched", renderBatched)):
+        seconds = base if func is reference else best(func, args.repeat)
+        print("{:>10} {:>10.3f} {:>12.0f} {:>7.2f}x".format(name, seconds, args.terms / seconds, base / seconds))
@@ -0,0 +1,281 @@
+# Offline import benchmark.
+#
+# Starts the local stand-in server and imports synthetic sets of every size,
+# each in a fresh process so peak RSS is measured per size:
+#
+#   python bench/run.py --sizes 100,1000,10000,50000
+#   python bench/run.py --sizes 1000 --latency 0.05 --json results.json
+#   python bench/run.py --fixtures fixtures --sets 160732581
+#   python bench/run.py --sizes 100,1000 --api
+#   python bench/run.py --sizes 1000 --no-limiter --no-media-cache
+#
+# The rate limiter and the media cache are set up from config.json like in
+# the add-on, the cache starts out empty in the temporary directory.
+# Every set goes through the add-on's own DeckImporter. The notes go into a
+# temporary Anki collection, or with --fake into an in-memory stand-in that
+# leaves Anki's backend out; the anki package is needed either way.
+
+import argparse, importlib, json, os, subprocess, sys, tempfile, time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+# the add-on uses relative imports, so load it as a package
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+addon = os.path.basename(ADDON_DIR)
+cache = importlib.import_module(addon + ".cache")
+engine = importlib.import_module(addon + ".engine")
+extract = importlib.import_module(addon + ".extract")
+importer = importlib.import_module(addon + ".importer")
+network = importlib.import_module(addon + ".network")
+stats = importlib.import_module(addon + ".stats")
+
+PHASES = ["set page", "extract", "paging", "media", "notes"]
+
+def peakRss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def loadConfig(args):
+    with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    config["add_audio"] = not args.no_audio
+    config["json_api"] = args.api
+    if args.media_workers:
+        config["media_workers"] = args.media_workers
+    if args.paging_workers:
+        config["paging_workers"] = args.paging_workers
+    if args.no_limiter:
+        config["requests_per_second"] = 1000
+    if args.no_media_cache:
+        config["media_cache"] = False
+    return config
+
+# the parts of a collection that DeckImporter uses, notes are only kept in memory
+class FakeNote(dict):
+
+    def __init__(self):
+        super().__init__()
+        self.id = 0
+        self.tags = []
+
+    def flush(self):
+        pass
+
+class FakeModels:
+
+    def __init__(self):
+        self.models = {}
+
+    def by_name(self, name):
+        return self.models.get(name)
+
+    def field_names(self, model):
+        return [f["name"] for f in model["flds"]]
+
+    def new(self, name):
+        return {"name": name, "flds": [], "tmpls": []}
+
+    def new_field(self, name):
+        return {"name": name}
+
+    def add_field(self, model, field):
+        model["flds"].append(field)
+
+    def new_template(self, name):
+        return {"name": name}
+
+    def add_template(self, model, template):
+        model["tmpls"].append(template)
+
+    addTemplate = add_template
+
+    def add(self, model):
+        model["id"] = len(self.models) + 1
+        self.models[model["name"]] = model
+
+    def save(self, model):
+        pass
+
+    def set_current(self, model):
+        pass
+
+class FakeDecks:
+
+    def __init__(self):
+        self.decks = {}
+
+    def id(self, name):
+        return self.decks.setdefault(name, len(self.decks) + 1)
+
+    def get(self, did):
+        return {"id": did}
+
+    def select(self, did):
+        pass
+
+    def save(self, deck):
+        pass
+
+class FakeMedia:
+
+    def __init__(self, path):
+        self.path = path
+
+    def dir(self):
+        return self.path
+
+    def write_data(self, file_name, data):
+        with open(os.path.join(self.path, file_name), "wb") as f:
+            f.write(data)
+        return file_name
+
+class FakeDb:
+
+    def execute(self, sql, *args):
+        return []
+
+class FakeCollection:
+
+    def __init__(self, path):
+        media_dir = os.path.join(path, "collection.media")
+        os.makedirs(media_dir, exist_ok=True)
+        self.media = FakeMedia(media_dir)
+        self.models = FakeModels()
+        self.decks = FakeDecks()
+        self.db = FakeDb()
+        self.notes = []
+
+    def newNote(self):
+        return FakeNote()
+
+    def addNote(self, note):
+        note.id = len(self.notes) + 1
+        self.notes.append(note)
+
+    def close(self):
+        pass
+
+def openCollection(path, fake=False):
+    if fake:
+        return FakeCollection(path)
+    from anki.collection import Collection
+    return Collection(os.path.join(path, "collection.anki2"))
+
+# import one set through the add-on's importer and time every phase
+def importSet(base, sid, config, col, path):
+    network.QUIZLET_URL = base
+    run_stats = stats.ImportStats()
+    session = engine.openSession(config, stats=run_stats)
+    limiter = network.RateLimiter(config["requests_per_second"])
+    media_cache = None
+    if config["media_cache"]:
+        media_cache = cache.MediaCache(os.path.join(path, "media_cache"), config["media_cache_size_mb"] * 1024 * 1024)
+    try:
+        result = importer.downloadSetData(session, limiter, str(sid), stats=run_stats, api=config["json_api"])
+        importer.DeckImporter(col, config, session, limiter, media_cache, run_stats).importSet(result, str(sid))
+        if media_cache:
+            with run_stats.phase("media cache"):
+                media_cache.save()
+    finally:
+        session.close()
+    phases = dict(run_stats.phases)
+    # the json api takes the place of the set page
+    if "set api" in phases:
+        phases["set page"] = phases.get("set page", 0.0) + phases.pop("set api")
+    return {"terms": result["term_count"], "media": len(os.listdir(col.media.dir())), "phases": phases}
+
+def importFolder(base, sizes, config):
+    network.QUIZLET_URL = base
+    session = network.createSession(config)
+    limiter = network.RateLimiter(config["requests_per_second"])
+    start = time.perf_counter()
+    body = network.fetchPage(session, limiter, "{}/folders/1/sets?sizes={}".format(base, ",".join(map(str, sizes))))
+    models = extract.extractFolderData(body)
+    assert len(models["folderStudyMaterial"]) == len(sizes)
+    session.close()
+    return time.perf_counter() - start
+
+def runChild(args):
+    config = loadConfig(args)
+    with tempfile.TemporaryDirectory() as path:
+        col = openCollection(path, args.fake)
+        start = time.perf_counter()
+        result = importSet(args.base, args.child, config, col, path)
+        result["total"] = time.perf_counter() - start
+        col.close()
+    result["set"] = args.child
+    result["collection"] = type(col).__name__
+    result["peak_rss"] = peakRss()
+    print(json.dumps(result))
+
+def runParent(args):
+    from server import StandInServer, setId
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if args.sets:
+        set_ids = [int(s) for s in args.sets.split(",")]
+    else:
+        set_ids = [setId(size) for size in sizes]
+    server = StandInServer(fixtures_dir=args.fixtures, latency=args.latency).start()
+
+    results = []
+    for sid in set_ids:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(sid), "--base", server.base]
+        for flag in ("no_audio", "fake", "api", "no_limiter", "no_media_cache"):
+            if getattr(args, flag):
+                cmd.append("--" + flag.replace("_", "-"))
+        for option in ("media_workers", "paging_workers"):
+            if getattr(args, option):
+                cmd.extend(["--" + option.replace("_", "-"), str(getattr(args, option))])
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    folder_time = importFolder(server.base, sizes, loadConfig(args))
+    server.shutdown()
+
+    header = "{:>7} {:>10} {:>10} {:>9}".format("terms", "terms/s", "media/s", "peak RSS")
+    header += "".join(" {:>9}".format(p) for p in PHASES)
+    print(header)
+    for r in results:
+        media_time = r["phases"]["media"]
+        line = "{:>7} {:>10.0f} {:>10.0f} {:>8.0f}M".format(
+            r["terms"],
+            r["terms"] / r["total"],
+            r["media"] / media_time if media_time else 0,
+            (r["peak_rss"] or 0) / 1024 / 1024,
+        )
+        line += "".join(" {:>8.3f}s".format(r["phases"].get(p, 0.0)) for p in PHASES)
+        print(line)
+    print("folder page with {} sets: {:.3f}s, collection: {}".format(len(sizes), folder_time, results[0]["collection"]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sets": results, "folder": folder_time}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Quizlet import benchmark")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="comma separated set sizes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--fixtures", help="directory with responses recorded by record.py")
+    parser.add_argument("--sets", help="comma separated IDs of recorded sets, instead of --sizes")
+    parser.add_argument("--media-workers", type=int)
+    parser.add_argument("--paging-workers", type=int)
+    parser.add_argument("--no-audio", action="store_true", help="skip the TTS files")
+    parser.add_argument("--fake", action="store_true", help="don't use a real Anki collection")
+    parser.add_argument("--api", action="store_true", help="get the sets from the json api instead of the set page")
+    parser.add_argument("--no-limiter", action="store_true", help="don't hold requests to requests_per_second")
+    parser.add_argument("--no-media-cache", action="store_true", help="don't keep the media in a media cache")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        runChild(args)
+    else:
+        runParent(args)
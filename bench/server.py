@@ -0,0 +1,150 @@
+# Local stand-in for quizlet.com used by the benchmarks.
+#
+#   /<setId>/flashcards                      set page, the set size is setId - SET_ID_BASE
+#   /webapi/3.4/studiable-item-documents     paged terms
+#   /webapi/3.4/sets/<setId>                 set metadata
+#   /folders/<id>/sets?sizes=100,1000        folder page with a set of every size
+#   /img/<name>.png, /tts/en.mp3?...         images and TTS files
+#
+# With --fixtures every response recorded by record.py is served first.
+# --slow and --errors make a share of the media responses stall or fail with
+# a 503, like a flaky CDN.
+
+import argparse, hashlib, os, random, re, sys, threading, time, urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+SET_ID_BASE = 900000000
+BASE_PLACEHOLDER = b"{{BASE}}"
+
+def setId(size):
+    return SET_ID_BASE + size
+
+def fixtureName(path):
+    return hashlib.sha1(path.encode("utf-8")).hexdigest()
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count(self.path)
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if server.fixtures:
+            path = os.path.join(server.fixtures, fixtureName(self.path))
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    body = f.read().replace(BASE_PLACEHOLDER, server.base.encode("utf-8"))
+                return self.send(body, "application/octet-stream")
+
+        m = re.match(r"^/(\d+)/flashcards$", url.path)
+        if m:
+            total = int(m.group(1)) - SET_ID_BASE
+            return self.send(fixtures.setPage(server.base, int(m.group(1)), total), "text/html; charset=utf-8")
+
+        if url.path == "/webapi/3.4/studiable-item-documents":
+            sid = int(query["filters[studiableContainerId]"][0])
+            page = int(query["page"][0])
+            perPage = int(query["perPage"][0])
+            body = fixtures.itemsPage(server.base, sid, sid - SET_ID_BASE, page, perPage)
+            return self.send(body, "application/json")
+
+        m = re.match(r"^/webapi/3.4/sets/(\d+)$", url.path)
+        if m:
+            return self.send(fixtures.setJson(int(m.group(1))), "application/json")
+
+        m = re.match(r"^/folders/(\d+)/", url.path)
+        if m:
+            sizes = [int(s) for s in query.get("sizes", ["100"])[0].split(",")]
+            sets = [(setId(size), size) for size in sizes]
+            return self.send(fixtures.folderPage(server.base, int(m.group(1)), sets), "text/html; charset=utf-8")
+
+        if url.path.startswith(("/img/", "/tts/")):
+            fault = server.fault()
+            if fault == "error":
+                return self.send(b"unavailable", "text/plain", 503)
+            if fault == "stall":
+                time.sleep(server.stall)
+
+        if url.path.startswith("/img/"):
+            return self.send(fixtures.IMAGE_BYTES, "image/png")
+
+        if url.path.startswith("/tts/"):
+            return self.send(fixtures.AUDIO_BYTES, "audio/mpeg")
+
+        self.send(b"not found", "text/plain", 404)
+
+class StandInServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port=0, fixtures_dir=None, latency=0.0, slow=0.0, errors=0.0, stall=5.0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.base = "http://127.0.0.1:{}".format(self.server_address[1])
+        self.fixtures = fixtures_dir
+        self.latency = latency
+        self.slow = slow
+        self.errors = errors
+        self.stall = stall
+        self.random = random.Random(1)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    # clients hang up on stalled responses when they give up on them
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    # "stall", "error" or None for a media response
+    def fault(self):
+        with self.lock:
+            x = self.random.random()
+        if x < self.errors:
+            return "error"
+        if x < self.errors + self.slow:
+            return "stall"
+        return None
+
+    def count(self, path):
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for quizlet.com")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--fixtures", help="directory with responses recorded by record.py")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--slow", type=float, default=0.0, help="share of media responses that stall")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of media responses that fail with a 503")
+    parser.add_argument("--stall", type=float, default=5.0, help="seconds a slow media response takes")
+    args = parser.parse_args()
+    server = StandInServer(args.port, args.fixtures, args.latency, args.slow, args.errors, args.stall)
+    print(server.base, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,212 @@
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+
+# persistent content-addressed store for downloaded images and TTS files,
+# the index maps a url to its file name and the sha1 of its content, every
+# blob is stored once and the least recently used ones are evicted when the
+# cache grows past its size limit (0 means no limit)
+class MediaCache:
+
+    def __init__(self, path, max_size=0):
+        self.path = path
+        self.blobs = os.path.join(path, "blobs")
+        self.index_path = os.path.join(path, "index.json")
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.blobs, exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        # sha1 -> size with the least recently used blob first, the urls of
+        # every blob and the running total of the blob sizes
+        self.lru = OrderedDict()
+        self.urls = {}
+        self.total = 0
+        used = {}
+        for url, entry in self.index.items():
+            used[entry["sha1"]] = max(used.get(entry["sha1"], 0), entry["used"])
+            self.urls.setdefault(entry["sha1"], set()).add(url)
+            if entry["sha1"] not in self.lru:
+                self.lru[entry["sha1"]] = entry["size"]
+                self.total += entry["size"]
+        for sha1 in sorted(used, key=used.get):
+            self.lru.move_to_end(sha1)
+
+    def blobPath(self, sha1):
+        return os.path.join(self.blobs, sha1)
+
+    # the file name and content stored for a url, or None
+    def get(self, url):
+        with self.lock:
+            entry = self.index.get(url)
+            if not entry:
+                self.misses += 1
+                return None
+        try:
+            with open(self.blobPath(entry["sha1"]), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                if self.index.get(url) is entry:
+                    self.forget(url)
+                self.misses += 1
+            return None
+        with self.lock:
+            entry["used"] = time.time()
+            if entry["sha1"] in self.lru:
+                self.lru.move_to_end(entry["sha1"])
+            self.dirty = True
+            self.hits += 1
+        return entry["file"], data
+
+    def put(self, url, file_name, data):
+        sha1 = hashlib.sha1(data).hexdigest()
+        path = self.blobPath(sha1)
+        if not os.path.exists(path):
+            tmp = "{}.{}.tmp".format(path, threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self.lock:
+            # a url whose content changed may leave its old blob unused
+            unused = self.forget(url) if url in self.index else None
+            self.index[url] = {"file": file_name, "sha1": sha1, "size": len(data), "used": time.time()}
+            self.urls.setdefault(sha1, set()).add(url)
+            if sha1 in self.lru:
+                self.lru.move_to_end(sha1)
+            else:
+                self.lru[sha1] = len(data)
+                self.total += len(data)
+            self.dirty = True
+            evicted = self.evict()
+            if unused and unused != sha1:
+                evicted.append(unused)
+        for sha1 in evicted:
+            try:
+                os.remove(self.blobPath(sha1))
+            except OSError:
+                pass
+
+    # drop a url from the index, its blob goes once no url refers to it and
+    # its sha1 is returned; called with the lock held
+    def forget(self, url):
+        sha1 = self.index.pop(url)["sha1"]
+        urls = self.urls.get(sha1)
+        if urls is not None:
+            urls.discard(url)
+            if not urls:
+                del self.urls[sha1]
+                self.total -= self.lru.pop(sha1, 0)
+                self.dirty = True
+                return sha1
+        self.dirty = True
+        return None
+
+    # the least recently used blobs while the cache is over its limit, they
+    # are taken out of the index and their files are removed by the caller;
+    # called with the lock held
+    def evict(self):
+        evicted = []
+        while self.max_size and self.total > self.max_size and self.lru:
+            sha1, size = self.lru.popitem(last=False)
+            self.total -= size
+            for url in self.urls.pop(sha1, ()):
+                del self.index[url]
+            evicted.append(sha1)
+        return evicted
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = "{}.{}.tmp".format(self.index_path, os.getpid())
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.index, f)
+            os.replace(tmp, self.index_path)
+            self.dirty = False
+
+# local copies of set and folder pages, an entry younger than the ttl is used
+# as it is, an older one is revalidated with its ETag / Last-Modified headers
+class PageCache:
+
+    # entries that weren't used for this long are removed
+    max_age = 30 * 24 * 3600
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "revalidated": 0, "misses": 0}
+        # urls whose stored body was handed out during this run
+        self.reused = set()
+        os.makedirs(path, exist_ok=True)
+        self.prune()
+
+    def entryPath(self, url):
+        return os.path.join(self.path, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def prune(self):
+        now = time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # the cached entry of a url: fetched time, validators and the page body
+    def get(self, url):
+        path = self.entryPath(url)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                entry = json.load(f)
+            with open(path + ".body", "rb") as f:
+                entry["body"] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def reuse(self, url):
+        with self.lock:
+            self.reused.add(url)
+
+    def wasReused(self, url):
+        with self.lock:
+            return url in self.reused
+
+    def isFresh(self, entry):
+        return time.time() - entry["fetched"] < self.ttl
+
+    def put(self, url, body, headers):
+        path = self.entryPath(url)
+        entry = {
+            "url": url,
+            "fetched": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        with self.lock:
+            self.reused.discard(url)
+        with open(path + ".body.tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".body.tmp", path + ".body")
+        self.touch(url, entry)
+
+    # mark an entry as fetched right now, after a 304 Not Modified
+    def touch(self, url, entry):
+        entry = {k: v for k, v in entry.items() if k != "body"}
+        entry["fetched"] = time.time()
+        path = self.entryPath(url)
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".json.tmp", path + ".json")
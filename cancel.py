@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, wait
+
+# raised wherever an import run notices that it was cancelled; it's a
+# CancelledError, like the one of a future or a request the async engine
+# aborted, so callers only need to handle one of them
+class ImportCancelled(CancelledError):
+    pass
+
+# cancellation of an import run, carried by its session so it reaches every
+# network and parse stage. Cancelling wakes up whoever sleeps or waits for a
+# future through the token right away and runs the registered callbacks, e.g.
+# the async engine aborting its transfers; everything else stops at its next
+# check. A blocking transfer that's already running can't be interrupted, it
+# ends with its timeout in the background and its result is dropped
+class CancelToken:
+
+    def __init__(self):
+        # done once cancelled, waiting for it along with other futures is
+        # what makes the waits return immediately
+        self.future = Future()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def isCancelled(self):
+        return self.future.done()
+
+    def cancel(self):
+        with self.lock:
+            if self.future.done():
+                return
+            self.future.set_result(None)
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    # called when the token is cancelled, or right away if it already is
+    def onCancel(self, callback):
+        with self.lock:
+            if not self.future.done():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        if self.isCancelled():
+            raise ImportCancelled()
+
+    def sleep(self, seconds):
+        wait([self.future], timeout=seconds)
+        self.check()
+
+    # like concurrent.futures.wait with FIRST_COMPLETED
+    def wait(self, futures, timeout=None):
+        done, pending = wait(set(futures) | {self.future}, timeout=timeout, return_when=FIRST_COMPLETED)
+        self.check()
+        pending.discard(self.future)
+        return done, pending
+
+    def result(self, future):
+        self.wait([future])
+        return future.result()
+
+# the token of a session of an import run; sessions made without one, like the
+# plain ones of the benchmarks, get a token that's never cancelled
+def sessionToken(session):
+    return getattr(session, "token", None) or CancelToken()
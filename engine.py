@@ -0,0 +1,183 @@
+import asyncio, threading, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from curl_cffi import CurlOpt
+from curl_cffi.requests import AsyncSession, RequestsError
+
+from .cancel import CancelToken
+from .media import mediaFileName
+from .network import IMPERSONATE, createSession, retryDelay, timeouts
+from .policy import RequestPolicy
+from .stats import ImportStats, InstrumentedSession
+
+# asyncio download engine, selected with "engine": "async" in the config;
+# one event loop in a background thread runs every request of an import run
+# on a curl_cffi AsyncSession. Blocking code calls get() like on a regular
+# session, media files are submitted as coroutines so thousands of them can
+# be in flight without a thread each. Requests to the same host share a
+# concurrency limit; cancelling the token of the run aborts every transfer at
+# once, close() cancels whatever is still running.
+class AsyncEngine:
+
+    def __init__(self, config, cookies=None, stats=None, token=None):
+        self.config = config
+        self.token = token or CancelToken()
+        self.stats = stats or ImportStats()
+        self.policy = RequestPolicy(config, self.stats)
+        self.per_host = max(1, config["per_host_connections"])
+        self.hosts = {}
+        self.tasks = set()
+        self.closed = False
+        self.loop = asyncio.new_event_loop()
+        # cache reads and writes of media files are handed to a couple of threads
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+        self.thread = threading.Thread(target=self.loop.run_forever, name="quizlet-engine", daemon=True)
+        self.thread.start()
+        self.session = self.submit(self.openSession(cookies)).result()
+        self.token.onCancel(self.cancel)
+
+    async def openSession(self, cookies):
+        return AsyncSession(
+            impersonate=IMPERSONATE,
+            cookies=cookies or {},
+            timeout=timeouts(self.config),
+            max_clients=self.config["max_connections"],
+            curl_options={CurlOpt.MAXCONNECTS: self.config["max_connections"]},
+        )
+
+    # run a coroutine on the loop, returns a concurrent future that can be
+    # waited for from any thread; cancelling it cancels the coroutine
+    def submit(self, coro):
+        if self.closed or self.token.isCancelled():
+            coro.close()
+            self.token.check()
+            raise RuntimeError("The download engine is closed")
+        return asyncio.run_coroutine_threadsafe(self.track(coro), self.loop)
+
+    async def track(self, coro):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self.tasks.discard(task)
+
+    # semaphores are only used on the loop, so they need no lock
+    def hostLimit(self, url):
+        host = urllib.parse.urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = asyncio.Semaphore(self.per_host)
+        return self.hosts[host]
+
+    async def request(self, url, limit=True, **kwargs):
+        if limit:
+            async with self.hostLimit(url):
+                r = await self.session.get(url, **kwargs)
+        else:
+            r = await self.session.get(url, **kwargs)
+        self.stats.add("requests")
+        self.stats.add("bytes", len(r.content))
+        return r
+
+    # blocking GET, for the code that runs in worker threads
+    def get(self, url, **kwargs):
+        return self.token.result(self.submit(self.request(url, **kwargs)))
+
+    # an image or TTS file like media.downloadFile, without a thread of its own
+    async def downloadFile(self, url, cache=None):
+        if cache:
+            cached = await self.loop.run_in_executor(None, cache.get, url)
+            if cached:
+                return cached
+        download_url, file_name = mediaFileName(url)
+        r = await self.fetchMedia(download_url)
+        if r is not None and r.status_code == 200:
+            if cache:
+                await self.loop.run_in_executor(None, cache.put, url, file_name, r.content)
+            return file_name, r.content
+        return file_name, None
+
+    # RequestPolicy.get on the loop: the slower request of a hedged pair is
+    # cancelled instead of running to its end
+    async def fetchMedia(self, url):
+        policy = self.policy
+        reason = None
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                self.stats.add("media retries")
+                await asyncio.sleep(retryDelay(attempt - 1))
+            try:
+                r = await self.hedged(url)
+            except RequestsError as e:
+                reason = str(e) or type(e).__name__
+                continue
+            if policy.retryable(r) and attempt < policy.retries:
+                continue
+            if r.status_code != 200:
+                policy.fail(url, "HTTP {}".format(r.status_code))
+            return r
+        policy.fail(url, reason)
+        return None
+
+    async def timedRequest(self, url, limit=True):
+        return self.policy.record(await self.request(url, limit))
+
+    # the delay counts from when the first request got its turn on the host,
+    # the duplicate doesn't queue again, so there's at most one extra request
+    # to a host for every running one
+    async def hedged(self, url):
+        async with self.hostLimit(url):
+            delay = self.policy.hedgeDelay()
+            if delay is None:
+                return await self.timedRequest(url, False)
+            return await self.race(url, delay)
+
+    async def race(self, url, delay):
+        requests = [asyncio.ensure_future(self.timedRequest(url, False))]
+        try:
+            done, pending = await asyncio.wait(requests, timeout=delay)
+            if not done:
+                self.stats.add("hedged requests")
+                requests.append(asyncio.ensure_future(self.timedRequest(url, False)))
+                done, pending = await asyncio.wait(requests, return_when=asyncio.FIRST_COMPLETED)
+            task = done.pop()
+            if task.exception() is not None and pending:
+                # the other one may still get through
+                task = pending.pop()
+                await asyncio.wait([task])
+            elif task is not requests[0]:
+                self.stats.add("hedges won")
+            return task.result()
+        finally:
+            for task in requests:
+                task.cancel()
+
+    def submitFile(self, url, cache=None):
+        return self.submit(self.downloadFile(url, cache))
+
+    # abort every request that is still running, the blocked callers get a CancelledError
+    def cancel(self):
+        def cancelAll():
+            for task in list(self.tasks):
+                task.cancel()
+        if not self.closed:
+            self.loop.call_soon_threadsafe(cancelAll)
+
+    def close(self):
+        if self.closed:
+            return
+        self.cancel()
+        self.closed = True
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+# the session of an import run, either the async engine or a pooled blocking
+# session that counts its transfers
+def openSession(config, cookies=None, stats=None, token=None):
+    if config["engine"] == "async":
+        return AsyncEngine(config, cookies, stats, token)
+    stats = stats or ImportStats()
+    return InstrumentedSession(createSession(config, cookies), stats, RequestPolicy(config, stats),
+                               token or CancelToken())
@@ -0,0 +1,86 @@
+import json, os, re
+
+class ExtractError(Exception):
+    pass
+
+NEXT_DATA_START = b'<script id="__NEXT_DATA__" type="application/json">'
+SCRIPT_END = b'</script>'
+REDUX_STATE_KEY = b'"dehydratedReduxStateKey":'
+
+# byte range of the __NEXT_DATA__ json inside a page, found with plain index
+# searches so the page is never decoded or copied as a whole
+def findNextData(body):
+    start = body.find(NEXT_DATA_START)
+    if start == -1:
+        raise ExtractError("NO MATCH: __NEXT_DATA__ not found")
+    start += len(NEXT_DATA_START)
+    end = body.find(SCRIPT_END, start)
+    if end == -1:
+        raise ExtractError("NO MATCH: __NEXT_DATA__ is not closed")
+    return start, end
+
+# the redux state of a set page, the escaped json string is scanned directly
+# out of the page instead of parsing the whole __NEXT_DATA__ tree around it
+def extractReduxState(body):
+    start, end = findNextData(body)
+    pos = body.find(REDUX_STATE_KEY, start, end)
+    if pos == -1:
+        raise ExtractError("NO MATCH: dehydratedReduxStateKey not found")
+    pos += len(REDUX_STATE_KEY)
+    while body[pos:pos + 1].isspace():
+        pos += 1
+    if body[pos:pos + 1] != b'"':
+        # not a string, parse it in place
+        state, _ = json.JSONDecoder().raw_decode(body[pos:end].decode("utf-8"))
+        return state
+    chunk = body[pos:end].decode("utf-8")
+    data, _ = json.decoder.scanstring(chunk, 1)
+    del chunk
+    return json.loads(data)
+
+# pick a path of keys out of a nested dict, keeping only that subtree
+def pick(source, target, *path):
+    for key in path[:-1]:
+        source = source.get(key)
+        if not isinstance(source, dict):
+            return
+        target = target.setdefault(key, {})
+    if path[-1] in source:
+        target[path[-1]] = source[path[-1]]
+
+# only the parts of a set page the importer uses
+def extractSetData(body, url=""):
+    state = extractReduxState(body)
+    results = {}
+    pick(state, results, "setPage", "pagingMeta")
+    pick(state, results, "studyModesCommon", "studiableData", "studiableItems")
+    pick(state, results, "set", "title")
+    pick(state, results, "studyable", "title")
+    del state
+    results["title"] = extractTitle(body, os.path.basename(url.strip()) or "Quizlet Flashcards")
+    return results
+
+def extractTitle(body, default):
+    start = body.find(b'<title')
+    if start == -1:
+        return default
+    start = body.find(b'>', start)
+    end = body.find(b'</title>', start)
+    if start == -1 or end == -1:
+        return default
+    title = body[start + 1:end].decode("utf-8", "replace")
+    title = re.sub(r' Flashcards \| Quizlet$', '', title)
+    title = re.sub(r' \| Quizlet$', '', title)
+    title = re.sub(r'^Flashcards ', '', title)
+    title = re.sub(r'\s+', ' ', title)
+    return title.strip() or default
+
+# folder name and the sets in it from a folder page
+def extractFolderData(body):
+    start, end = findNextData(body)
+    models = json.loads(body[start:end])["props"]["pageProps"]["models"]
+    return {
+        "folder": models["folder"],
+        "set": models["set"],
+        "folderStudyMaterial": models["folderStudyMaterial"],
+    }
@@ -0,0 +1,655 @@
+import os, time, traceback, urllib.parse, cProfile
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+# Anki
+from aqt import mw
+from aqt.qt import *
+from aqt.utils import showText, tooltip
+
+try:
+    from anki.collection import OpChanges
+    from aqt.operations import CollectionOp
+except ImportError:
+    CollectionOp = None
+
+from curl_cffi import requests as curl_requests
+
+from .backfill import BackfillQueue, applyBatch, downloadBatch
+from .cache import MediaCache, PageCache
+from .cancel import CancelToken
+from .importer import DeckImporter, canAddInBulk, downloadSetData, parseSetId, resolveSets
+from .engine import openSession
+from .imaging import ImageOptimizer
+from .journal import ImportJournal
+from .network import RateLimiter
+from .stats import ImportStats
+
+addon_dir = os.path.dirname(__file__)
+
+
+# the importer as used by the dialog, a set is imported on a pool thread and
+# the progress is sent to the window; only the writes of the notes are
+# collection operations, started from the main thread, so Anki's progress
+# window is only up while a page of notes is written
+class WindowImporter(DeckImporter):
+
+    def __init__(self, window):
+        super(WindowImporter, self).__init__(mw.col, window.config, window.session, window.limiter,
+                                             window.media_cache, window.stats, window.journal, window.optimizer,
+                                             window.backfill)
+        self.window = window
+        self.last_progress = 0
+
+    def runOp(self, op):
+        future = Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                collectionOps.run(op, future.set_result, future.set_exception)
+
+        mw.taskman.run_on_main(run)
+        try:
+            return self.token.result(future)
+        except CancelledError:
+            # an op that hasn't started yet isn't run at all
+            future.cancel()
+            raise
+
+    # the label is updated through a queued signal, a few times per second at most
+    def progress(self, text):
+        now = time.time()
+        if now - self.last_progress >= 0.1:
+            self.last_progress = now
+            self.window.progressed.emit(text)
+
+
+# the collection operations of the imports and of the media backfill run one
+# at a time: each one checks the last undo step before it merges into its own
+# undo entry, two of them running at once could merge into each other's
+class CollectionOps:
+
+    def __init__(self):
+        self.pending = deque()
+        self.running = False
+
+    # called on the main thread, success gets the result of op(col)
+    def run(self, op, success, failure):
+        self.pending.append((op, success, failure))
+        self.runNext()
+
+    def runNext(self):
+        if self.running or not self.pending:
+            return
+        op, success, failure = self.pending.popleft()
+        self.running = True
+
+        def done(callback):
+            def finished(value):
+                self.running = False
+                try:
+                    callback(value)
+                finally:
+                    self.runNext()
+            return finished
+
+        if CollectionOp is None:
+            # older Anki versions, the op runs right here
+            try:
+                result = op(mw.col)
+            except Exception as e:
+                done(failure)(e)
+            else:
+                done(success)(result)
+            return
+        collection_op = CollectionOp(parent=mw, op=lambda col: op(col) or OpChanges())
+        collection_op.success(done(success))
+        collection_op.failure(done(failure))
+        collection_op.run_in_background()
+
+collectionOps = CollectionOps()
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object, object)
+
+
+# runs a blocking call on a pool thread, the result or the error is handed
+# back to the main thread through a signal
+class Task(QRunnable):
+
+    def __init__(self, func, *args):
+        super(Task, self).__init__()
+        self.setAutoDelete(False)
+        self.func = func
+        self.args = args
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            self.signals.finished.emit(None, e)
+        else:
+            self.signals.finished.emit(result, None)
+
+# run func(*args) on the pool, callback(result, error) is called on the main thread
+def startTask(pool, tasks, callback, func, *args):
+    task = Task(func, *args)
+    tasks.add(task)
+
+    def finished(result, error):
+        tasks.discard(task)
+        callback(result, error)
+
+    task.signals.finished.connect(finished)
+    pool.start(task)
+
+
+# fetches the media of notes that were added text first, a batch at a time:
+# the files are downloaded on the pool, then a collection op writes them and
+# fills them into the notes; what's left is picked up when Anki starts again
+class MediaBackfill:
+
+    def __init__(self):
+        self.queue = None
+        self.queue_col = None
+        self.running = False
+        self.session = None
+        self.token = None
+        self.media_cache = None
+        self.tasks = set()
+        self.done = 0
+        self.undo_entry = []
+
+    # the queue of the open collection, shared with the import that fills it
+    def openQueue(self):
+        if self.queue is None or self.queue_col != mw.col.path:
+            self.stop()
+            self.queue = BackfillQueue(os.path.join(addon_dir, "user_files", "backfill"), mw.col.path)
+            self.queue_col = mw.col.path
+        return self.queue
+
+    def start(self):
+        if self.running or mw.col is None or CollectionOp is None or not len(self.openQueue()):
+            return
+        self.config = mw.addonManager.getConfig(__name__)
+        self.running = True
+        self.done = 0
+        self.undo_entry = []
+        self.token = CancelToken()
+        self.session = openSession(self.config, token=self.token)
+        if self.config["media_cache"]:
+            self.media_cache = MediaCache(os.path.join(addon_dir, "user_files", "media_cache"),
+                                          self.config["media_cache_size_mb"] * 1024 * 1024)
+        self.nextBatch()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        # a batch that is still downloading gives up right away
+        self.token.cancel()
+        self.session.close()
+        self.session = None
+        if self.media_cache:
+            self.media_cache.save()
+            self.media_cache = None
+        if self.done:
+            tooltip("Downloaded the media of {} Quizlet fields".format(self.done))
+
+    def nextBatch(self):
+        entries = self.queue.batch(max(1, self.config["backfill_batch"]))
+        if not entries or mw.col is None:
+            self.stop()
+            return
+        startTask(QThreadPool.globalInstance(), self.tasks, lambda files, error: self.onDownloaded(entries, files, error),
+                  downloadBatch, self.session, entries, self.config, self.media_cache)
+
+    def onDownloaded(self, entries, files, error):
+        if not self.running or mw.col is None:
+            return
+        if error is not None:
+            # offline or blocked, the queue is kept for the next start
+            self.stop()
+            return
+
+        failed = []
+
+        def op(col):
+            changes, failures = applyBatch(col, entries, files, self.undo_entry)
+            failed.extend(failures)
+            return changes
+
+        def success(changes):
+            self.queue.finish(entries, failed)
+            self.done += len(entries) - len(failed)
+            if self.running:
+                self.nextBatch()
+
+        # queued behind the note writes of a running import
+        collectionOps.run(op, success, lambda exc: self.stop())
+
+mediaBackfill = MediaBackfill()
+
+
+class QuizletWindow(QWidget):
+
+    progressed = pyqtSignal(str)
+
+    # main window of Quizlet plugin
+    def __init__(self):
+        super(QuizletWindow, self).__init__()
+
+        self.results = None
+        self.session = None
+        self.token = None
+        self.limiter = None
+        self.media_cache = None
+        self.page_cache = None
+        self.stats = None
+        self.journal = None
+        self.optimizer = None
+        self.backfill = None
+        self.profiler = None
+        self.closed = False
+
+        # downloads run on the pool, the dialog only reacts to their signals
+        self.pool = QThreadPool(self)
+        self.tasks = set()
+        self.pending = deque()
+        self.queue = deque()
+        self.importing = False
+        self.failed = False
+        self.urls_results = {}
+
+        self.config = mw.addonManager.getConfig(__name__)
+
+        self.cookies = self.getCookies()
+
+        self.initGUI()
+        self.progressed.connect(self.label_results.setText)
+
+    # create GUI skeleton
+    def initGUI(self):
+
+        self.box_top = QVBoxLayout()
+
+        # left side
+        self.box_left = QVBoxLayout()
+
+        # quizlet url field
+        self.box_name = QHBoxLayout()
+        self.label_url = QLabel("Quizlet URL(s):")
+        self.text_url = QTextEdit("",self)
+        self.text_url.setAcceptRichText(False)
+        self.text_url.setMinimumWidth(300)
+
+        self.text_url.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        font_metrics = QFontMetrics(self.text_url.font())
+        line_height = font_metrics.height()
+        doc_margin = self.text_url.document().documentMargin()
+        margins = self.text_url.contentsMargins()
+        total_height = line_height + margins.top() + margins.bottom() + (2 * doc_margin)
+        self.text_url.setFixedHeight(int(total_height))
+        self.text_url.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.text_url.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.text_url.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.MinimumExpanding)
+        def autoResize():
+            self.text_url.document().setTextWidth(self.text_url.viewport().width())
+            margins = self.text_url.contentsMargins()
+            height = int(self.text_url.document().size().height() + margins.top() + margins.bottom())
+            self.text_url.setFixedHeight(height)
+            self.resize(self.minimumSizeHint())
+        self.text_url.textChanged.connect(autoResize)
+
+        self.box_name.addWidget(self.label_url)
+        self.box_name.addWidget(self.text_url)
+        # parentDeck field
+
+        self.box_parent = QHBoxLayout()
+        self.label_parentDeck = QLabel("Parent deck name:")
+        self.parentDeck = QLineEdit ("",self)
+        self.parentDeck.setMinimumWidth(150)
+        self.box_parent.addWidget(self.label_parentDeck)
+        self.box_parent.addWidget(self.parentDeck)
+
+        self.box_options = QHBoxLayout()
+        self.reverse_checkbox = QCheckBox('Add Reverse?', self)
+        self.reverse_checkbox.setChecked(self.config["add_reverse"])
+        self.box_options.addWidget(self.reverse_checkbox)
+        self.refresh_checkbox = QCheckBox('Force refresh?', self)
+        self.refresh_checkbox.setToolTip("Download the set and folder pages again instead of using the local copies")
+        self.box_options.addWidget(self.refresh_checkbox)
+        self.box_options.addStretch(1)
+
+        # code (import set) button
+        self.box_code = QHBoxLayout()
+        self.button_code = QPushButton("Import Deck", self)
+        self.button_code.setShortcut(QKeySequence("Ctrl+Return"))
+        self.box_code.addStretch(1)
+        self.box_code.addWidget(self.button_code)
+        self.button_code.clicked.connect(self.onCode)
+
+        # results label
+        self.label_info = QLabel("This importer has three use cases: 1. single url; 2. multiple urls on multiple lines and 3. folder.\nParent deck name can be cutomized. If not provided, it will either use the folder name \n(if a folder url is provided) or save the deck as a first-level deck.")
+        self.label_results = QLabel("Single url example: https://quizlet.com/vn/160732581/les-activites-flash-cards/")
+
+        # add all widgets to top layout
+        self.box_top.addLayout(self.box_name)
+        self.box_top.addLayout(self.box_parent)
+        self.box_top.addLayout(self.box_options)
+        self.box_top.addLayout(self.box_code)
+        self.box_top.addSpacing(10)
+        self.box_top.addWidget(self.label_info)
+        self.box_top.addSpacing(10)
+        self.box_top.addWidget(self.label_results)
+        self.setLayout(self.box_top)
+
+        # go, baby go!
+        self.setMinimumWidth(500)
+        self.setWindowTitle("Improved Quizlet to Anki Importer")
+        self.resize(self.minimumSizeHint())
+        self.setWindowIcon(QIcon('icon.png'))
+        self.show()
+
+    def getCookies(self):
+        cookies = {}
+        if self.config["qlts"]:
+            cookies = { "qlts": self.config["qlts"] }
+        return cookies
+
+    def onCode(self):
+        self.config["add_reverse"] = self.reverse_checkbox.isChecked()
+        mw.addonManager.writeConfig(__name__, self.config)
+
+        parentDeck = self.parentDeck.text()
+        # grab url input
+        urls = self.text_url.toPlainText().splitlines()
+        urls = [url.strip() for url in urls if url.strip() != ""]
+        if not urls:
+            return
+
+        for url in urls:
+            # voodoo needed for some error handling
+            if urllib.parse.urlparse(url).scheme:
+                urlDomain = urllib.parse.urlparse(url).netloc
+            else:
+                urlDomain = urllib.parse.urlparse("https://"+url).netloc
+
+            # validate quizlet URL
+            if not "quizlet.com" in urlDomain:
+                self.label_results.setText("Oops! That's not a Quizlet URL :(")
+                return
+
+        self.button_code.setEnabled(False)
+        self.label_results.setText(("There are <b>{0}</b> urls in total. Starting".format(len(urls))))
+        # an interrupted run of the same urls is resumed, unless a refresh was asked for
+        journal_dir = os.path.join(addon_dir, "user_files", "journal")
+        self.journal = ImportJournal(journal_dir, urls, parentDeck)
+        if self.refresh_checkbox.isChecked() and self.journal.resumed:
+            self.journal.discard()
+            self.journal = ImportJournal(journal_dir, urls, parentDeck)
+        if self.journal.resumed:
+            self.label_results.setText("Resuming the last import of these urls...")
+        self.stats = ImportStats()
+        # all requests of this import run share one pooled session or the async
+        # engine, closing the window cancels them through the token
+        self.token = CancelToken()
+        self.session = openSession(self.config, self.cookies, self.stats, self.token)
+        self.limiter = RateLimiter(self.config["requests_per_second"])
+        if self.config["media_cache"]:
+            self.media_cache = MediaCache(os.path.join(addon_dir, "user_files", "media_cache"),
+                                          self.config["media_cache_size_mb"] * 1024 * 1024)
+        if self.config["page_cache_ttl"]:
+            self.page_cache = PageCache(os.path.join(addon_dir, "user_files", "page_cache"),
+                                        self.config["page_cache_ttl"])
+        # text first: notes are added right away, their media is fetched afterwards
+        if self.config["media_backfill"] and CollectionOp is not None and canAddInBulk(mw.col):
+            self.backfill = mediaBackfill.openQueue()
+        if ImageOptimizer.enabled(self.config):
+            self.optimizer = ImageOptimizer(self.config)
+        # cProfile only sees the thread it's enabled on, that is the deck imports
+        self.profiler = cProfile.Profile() if self.config["profile"] else None
+        self.pool.setMaxThreadCount(max(1, self.config["set_workers"]) + 1)
+        self.urls_results = {}
+        self.failed = False
+
+        self.runTask(self.onUrlsResolved, self.resolveUrls, urls, parentDeck, self.refresh_checkbox.isChecked())
+
+    def runTask(self, callback, func, *args):
+        startTask(self.pool, self.tasks, callback, func, *args)
+
+    # the plan of sets to import, every set remembers the url it came from
+    # for the final report; runs on the pool
+    def resolveUrls(self, urls, parentDeck, refresh):
+        if self.journal.jobs() is not None:
+            return [tuple(job) for job in self.journal.jobs()], 0
+        jobs, duplicates = resolveSets(self.session, self.limiter, urls, parentDeck, self.page_cache, refresh,
+                                       self.stats, self.config["set_workers"])
+        if not self.closed:
+            self.journal.setJobs(jobs)
+        return jobs, duplicates
+
+    def onUrlsResolved(self, plan, error):
+        jobs = []
+        if error is not None:
+            self.label_results.setText("Unknown Error")
+            if not self.closed:
+                showText(self.formatError(error))
+            self.failed = True
+        else:
+            jobs, duplicates = plan
+            text = "Found <b>{0}</b> sets in total".format(len(jobs))
+            if duplicates:
+                text += ", skipping <b>{0}</b> duplicates".format(duplicates)
+            self.label_results.setText(text + ". Starting")
+        self.pending = deque(jobs)
+        self.importNext()
+
+    # several set pages are downloaded at once, the shared rate limiter keeps
+    # the request rate in check; decks are still created one at a time and
+    # in the original order
+    def startDownloads(self):
+        while self.pending and len(self.queue) < max(1, self.config["set_workers"]) and not self.closed:
+            url_index, urlPath, parentDeck = self.pending.popleft()
+            self.queue.append(self.downloadSet(url_index, urlPath, parentDeck))
+
+    # start downloading a set page, the returned entry is filled in once it's done
+    def downloadSet(self, url_index, urlPath, parentDeck):
+        entry = {"url_index": url_index, "parentDeck": parentDeck, "id": None,
+                 "done": False, "result": None, "error": None}
+
+        # validate and set Quizlet deck ID
+        try:
+            entry["id"] = parseSetId(urlPath)
+        except ValueError as e:
+            entry.update(done=True, invalid=str(e))
+            return entry
+
+        # imported by an earlier run that was interrupted later on
+        finished = self.journal.finishedSet(entry["id"])
+        if finished:
+            entry.update(done=True, result=finished, resumed=True)
+            return entry
+
+        # and aaawaaaay we go...
+        self.label_results.setText("Connecting to Quizlet...")
+
+        def finished(result, error):
+            entry.update(done=True, result=result, error=error)
+            self.importNext()
+
+        # download the data!
+        self.runTask(finished, downloadSetData, self.session, self.limiter, entry["id"],
+                     self.page_cache, self.refresh_checkbox.isChecked(), self.stats, self.config["json_api"])
+        return entry
+
+    # import the downloaded sets in order, called whenever something finished
+    def importNext(self):
+        while not self.importing and not self.closed and self.queue and self.queue[0]["done"]:
+            self.finishSet(self.queue.popleft())
+        self.startDownloads()
+        if self.importing or (self.closed and self.tasks):
+            return
+        if self.closed or not (self.queue or self.pending):
+            self.finishRun()
+
+    def finishRun(self):
+        if self.session is None:
+            return
+        self.session.close()
+        self.session = None
+        self.reportStats(self.profiler)
+        if self.media_cache:
+            self.media_cache.save()
+            self.media_cache = None
+        self.page_cache = None
+        if self.optimizer:
+            self.optimizer.shutdown()
+            self.optimizer = None
+        self.profiler = None
+        # keep the journal around until a run gets through without errors
+        if self.closed or self.failed:
+            self.journal.save()
+        else:
+            self.journal.discard()
+        self.journal = None
+        self.backfill = None
+        self.button_code.setEnabled(True)
+
+    # show a short summary of where the time went and keep a json log of it
+    def reportStats(self, profiler=None):
+        if len(self.urls_results) > 1:
+            self.label_results.setText('<br>'.join(self.urls_results[i] for i in sorted(self.urls_results)))
+
+        stats = self.stats
+        if self.media_cache:
+            stats.add("media cache hits", self.media_cache.hits)
+        if self.page_cache:
+            stats.add("page cache hits", self.page_cache.counts["hits"] + self.page_cache.counts["revalidated"])
+        if not stats.sets:
+            return
+
+        log_dir = os.path.join(addon_dir, "user_files", "logs")
+        os.makedirs(log_dir, exist_ok=True)
+        log_name = os.path.join(log_dir, time.strftime("import-%Y%m%d-%H%M%S"))
+        with open(log_name + ".json", "w", encoding="utf-8") as f:
+            f.write(stats.toJson())
+        if profiler:
+            profiler.dump_stats(log_name + ".prof")
+
+        self.label_results.setText("{}<br><small>{}</small>".format(self.label_results.text(), stats.summary()))
+        if stats.failed_media:
+            self.label_results.setText("{}<br><small>The media that couldn't be downloaded are listed in {}.json</small>".format(
+                self.label_results.text(), log_name))
+
+    def closeEvent(self, evt):
+        self.closed = True
+        # every stage of the run stops, the async engine aborts the requests
+        # that are still running
+        if self.token:
+            self.token.cancel()
+        evt.accept()
+
+    def formatError(self, error):
+        return "{}\n-----------------\n{}".format(
+            error, "".join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+    # create the deck of a downloaded set and report how it went
+    def finishSet(self, entry):
+        error = entry["error"]
+        if entry.get("resumed"):
+            self.label_results.setText("Already imported <b>{0}</b>".format(entry["result"]["title"]))
+        # invalid url, the set was never downloaded
+        elif "invalid" in entry:
+            self.label_results.setText(entry["invalid"])
+        # error fetching data
+        elif isinstance(error, curl_requests.exceptions.HTTPError):
+            if error.response.status_code == 403:
+                if "CF-Chl-Bypass" in error.response.headers:
+                    self.label_results.setText("Sorry, it's behind a captcha.")
+                else:
+                    self.label_results.setText("Sorry, this is a private deck :(")
+            elif error.response.status_code == 404:
+                self.label_results.setText("Can't find a deck with the ID <i>{0}</i>".format(entry["id"]))
+            else:
+                self.label_results.setText("Unknown Error")
+                showText(error.response.text)
+        elif isinstance(error, ValueError):
+            self.label_results.setText("Unknown Error")
+            showText("Invalid json: {0}".format(error))
+        elif error is not None:
+            self.label_results.setText("Unknown Error")
+            showText(self.formatError(error))
+        else: # everything went through, let's roll!
+            self.importSet(entry)
+            return
+        if not entry.get("resumed"):
+            self.failed = True
+        self.urls_results[entry["url_index"]] = self.label_results.text()
+
+    def importSet(self, entry):
+        deck = entry["result"]
+        self.label_results.setText(("Importing deck {0}...".format(deck["title"])))
+        importer = WindowImporter(self)
+        start = time.time()
+
+        def importDeck():
+            if self.profiler:
+                self.profiler.enable()
+            try:
+                importer.importSet(deck, entry["id"], entry["parentDeck"])
+            except CancelledError:
+                # the window was closed, the pages added so far are kept and
+                # the journal has what's needed to add the rest next time
+                pass
+            finally:
+                if self.profiler:
+                    self.profiler.disable()
+
+        def success():
+            self.importing = False
+            self.setImported(entry, start)
+            self.importNext()
+
+        def failure(error):
+            self.importing = False
+            self.failed = True
+            self.label_results.setText("Unknown Error")
+            self.urls_results[entry["url_index"]] = self.label_results.text()
+            if not self.closed:
+                showText(self.formatError(error))
+            self.importNext()
+
+        # the set is imported on the pool, the dialog and Anki stay usable;
+        # older Anki versions reset the main window once it's done, newer
+        # ones refresh after every collection operation
+        def finished(result, error):
+            if error is not None:
+                failure(error)
+                return
+            if CollectionOp is None:
+                with self.stats.phase("reset"):
+                    mw.reset()
+            success()
+
+        self.importing = True
+        self.runTask(finished, importDeck)
+
+    def setImported(self, entry, start):
+        deck = entry["result"]
+        self.stats.addSet(id=entry["id"], title=deck["title"], terms=deck["term_count"], added=deck["added"],
+                          updated=deck["updated"], unchanged=deck["unchanged"], duplicates=deck["duplicates"],
+                          seconds=time.time() - start)
+        if not self.closed:
+            self.journal.finishSet(entry["id"], {k: deck[k] for k in ("title", "term_count", "added", "updated", "unchanged", "duplicates")})
+        if self.backfill is not None:
+            mediaBackfill.start()
+        if deck["updated"] or deck["unchanged"]:
+            self.label_results.setText(("Success! Synced <b>{0}</b> ({1} new, {2} updated, {3} unchanged)".format(deck["title"], deck["added"], deck["updated"], deck["unchanged"])))
+        else:
+            self.label_results.setText(("Success! Imported <b>{0}</b> ({1} cards)".format(deck["title"], deck["added"])))
+        if deck["duplicates"]:
+            self.label_results.setText("{}, {} duplicates skipped".format(self.label_results.text(), deck["duplicates"]))
+        self.urls_results[entry["url_index"]] = self.label_results.text()
@@ -0,0 +1,223 @@
+# Import Quizlet sets without Anki's GUI, e.g. on a build box:
+#
+#   python headless.py --out decks URL [URL ...]
+#   python headless.py --collection collection.anki2 --urls-file urls.txt
+#
+# Folder urls are expanded first, then every set is downloaded in its own
+# process. With --out each set is written to its own .apkg file, with
+# --collection the sets are added to that collection one at a time. One line
+# per set reports OK or FAILED, followed by a MEDIA line for every image or
+# audio file that couldn't be downloaded after retries; the exit status is 0 when every set was
+# imported, 1 when some failed and 2 for bad arguments.
+
+import argparse, importlib, json, os, re, sys, tempfile, traceback, urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+if not __package__:
+    # run as a script (or a spawned worker of one), import the add-on as a
+    # package so the relative imports below work
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    __package__ = os.path.basename(addon_dir)
+    importlib.import_module(__package__)
+
+from . import engine
+from .cache import MediaCache, PageCache
+from .importer import DeckImporter, downloadSetData, firstPageItems, pagingMeta, parseSetId, resolveSets
+from .network import fetchItemPages, RateLimiter
+
+addon_dir = os.path.dirname(os.path.abspath(__file__))
+
+def loadConfig(path=None):
+    with open(os.path.join(addon_dir, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    return config
+
+def cookies(config):
+    return {"qlts": config["qlts"]} if config["qlts"] else {}
+
+# every process gets its share of the request rate
+def openSession(config, jobs):
+    session = engine.openSession(config, cookies(config))
+    limiter = RateLimiter(config["requests_per_second"] / max(1, jobs))
+    return session, limiter
+
+def caches(config):
+    media_cache = page_cache = None
+    if config["media_cache"]:
+        media_cache = MediaCache(os.path.join(addon_dir, "user_files", "media_cache"),
+                                 config["media_cache_size_mb"] * 1024 * 1024)
+    if config["page_cache_ttl"]:
+        page_cache = PageCache(os.path.join(addon_dir, "user_files", "page_cache"), config["page_cache_ttl"])
+    return media_cache, page_cache
+
+def failure(setUrl, e):
+    return {"url": setUrl, "ok": False, "error": str(e) or type(e).__name__, "traceback": traceback.format_exc()}
+
+def exportDeck(col, deck_id, out_path):
+    try:
+        from anki.collection import DeckIdLimit, ExportAnkiPackageOptions
+    except ImportError:
+        # older Anki versions
+        from anki.exporting import AnkiPackageExporter
+        exporter = AnkiPackageExporter(col)
+        exporter.did = deck_id
+        exporter.includeMedia = True
+        exporter.includeSched = False
+        exporter.exportInto(out_path)
+        return
+    options = ExportAnkiPackageOptions(with_scheduling=False, with_deck_configs=False, with_media=True, legacy=True)
+    col.export_anki_package(out_path=out_path, options=options, limit=DeckIdLimit(deck_id=deck_id))
+
+# worker: import a single set into a fresh collection and export it as .apkg
+def exportSet(job, config, jobs, out_dir):
+    from anki.collection import Collection
+
+    setUrl, parentDeck = job
+    try:
+        quizletDeckID = parseSetId(setUrl)
+        session, limiter = openSession(config, jobs)
+        media_cache, page_cache = caches(config)
+        result = downloadSetData(session, limiter, quizletDeckID, page_cache, api=config["json_api"])
+        with tempfile.TemporaryDirectory() as tmp:
+            col = Collection(os.path.join(tmp, "collection.anki2"))
+            try:
+                deck_id = DeckImporter(col, config, session, limiter, media_cache).importSet(result, quizletDeckID, parentDeck)
+                name = re.sub(r'[^\w\- ]+', '_', result["title"]).strip() or "Quizlet"
+                out_path = os.path.join(out_dir, "{}-{}.apkg".format(name, quizletDeckID))
+                exportDeck(col, deck_id, out_path)
+            finally:
+                col.close()
+        session.close()
+        if media_cache:
+            media_cache.save()
+        return {"url": setUrl, "ok": True, "id": quizletDeckID, "title": result["title"],
+                "terms": result["term_count"], "path": out_path,
+                "failed_media": session.policy.stats.failed_media}
+    except Exception as e:
+        return failure(setUrl, e)
+
+# worker: download a set with all of its pages, the main process adds it
+def fetchSet(job, config, jobs):
+    setUrl, parentDeck = job
+    try:
+        quizletDeckID = parseSetId(setUrl)
+        session, limiter = openSession(config, jobs)
+        result = downloadSetData(session, limiter, quizletDeckID, caches(config)[1], api=config["json_api"])
+        meta = pagingMeta(result)
+        if meta:
+            items = [item for page in fetchItemPages(session, limiter, meta, quizletDeckID,
+                                                     config["paging_workers"], config["max_retries"],
+                                                     first_items=firstPageItems(result))
+                     for item in page]
+            result["studyModesCommon"] = {"studiableData": {"studiableItems": items}}
+            del result["setPage"]
+        session.close()
+        return {"url": setUrl, "ok": True, "id": quizletDeckID, "result": result, "parentDeck": parentDeck}
+    except Exception as e:
+        return failure(setUrl, e)
+
+# the (set url, parent deck) pairs behind a list of set and folder urls
+def resolveUrls(urls, config, parentDeck=""):
+    session, limiter = openSession(config, 1)
+    page_cache = caches(config)[1]
+    for url in urls:
+        parsed = urllib.parse.urlparse(url if urllib.parse.urlparse(url).scheme else "https://" + url)
+        if "quizlet.com" not in parsed.netloc:
+            raise ValueError("not a Quizlet URL: {}".format(url))
+    try:
+        jobs, duplicates = resolveSets(session, limiter, urls, parentDeck, page_cache,
+                                       workers=config["set_workers"])
+    finally:
+        session.close()
+    if duplicates:
+        print("skipping {} duplicate sets".format(duplicates), file=sys.stderr)
+    return [(url, deck) for url_index, url, deck in jobs]
+
+def report(status):
+    if status["ok"]:
+        line = "OK      {id}  {title} ({terms} cards)".format(**status)
+        if status.get("path"):
+            line += "  " + status["path"]
+        print(line, flush=True)
+        for url, reason in status.get("failed_media", {}).items():
+            print("MEDIA   {}  {}".format(url, reason), file=sys.stderr, flush=True)
+    else:
+        print("FAILED  {url}  {error}".format(**status), file=sys.stderr, flush=True)
+    return status["ok"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import Quizlet sets without the Anki GUI")
+    parser.add_argument("urls", nargs="*", help="set or folder urls")
+    parser.add_argument("--urls-file", help="file with one url per line")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="directory for one .apkg file per set")
+    target.add_argument("--collection", help="add the sets to this collection file")
+    parser.add_argument("--parent-deck", default="", help="parent deck name")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="sets downloaded in parallel")
+    parser.add_argument("--config", help="json file with options that override config.json")
+    parser.add_argument("--audio", action="store_true", help="add the TTS audio")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, encoding="utf-8") as f:
+            urls.extend(f.read().splitlines())
+    urls = [url.strip() for url in urls if url.strip()]
+    if not urls:
+        parser.error("no urls given")
+
+    config = loadConfig(args.config)
+    if args.audio:
+        config["add_audio"] = True
+
+    try:
+        jobs = resolveUrls(urls, config, args.parent_deck)
+    except Exception as e:
+        print("FAILED  {}".format(e), file=sys.stderr)
+        return 1
+    print("{} sets to import".format(len(jobs)), flush=True)
+
+    ok = True
+    workers = max(1, min(args.jobs, len(jobs)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            futures = [executor.submit(exportSet, job, config, workers, args.out) for job in jobs]
+            for future in futures:
+                ok = report(future.result()) and ok
+        else:
+            from anki.collection import Collection
+            col = Collection(args.collection)
+            media_cache = caches(config)[0]
+            session, limiter = openSession(config, 1)
+            try:
+                # sets are downloaded in parallel but added one at a time
+                futures = [executor.submit(fetchSet, job, config, workers) for job in jobs]
+                for future in futures:
+                    status = future.result()
+                    if status["ok"]:
+                        try:
+                            result = status.pop("result")
+                            failed_media = session.policy.stats.failed_media
+                            before = set(failed_media)
+                            DeckImporter(col, config, session, limiter, media_cache).importSet(
+                                result, status["id"], status["parentDeck"])
+                            status.update(title=result["title"], terms=result["term_count"],
+                                          failed_media={url: reason for url, reason in failed_media.items()
+                                                        if url not in before})
+                        except Exception as e:
+                            status = failure(status["url"], e)
+                    ok = report(status) and ok
+            finally:
+                session.close()
+                if media_cache:
+                    media_cache.save()
+                col.close()
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import io, multiprocessing, os, sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pillow is optional, without it images are kept as they were downloaded
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+FORMAT_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+
+def isImage(file_name):
+    return os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS
+
+# name of an image once it's re-encoded, the stem stays the same so the
+# notes of earlier imports still match it
+def optimizedName(file_name, fmt):
+    return os.path.splitext(file_name)[0] + FORMAT_EXTENSIONS[fmt]
+
+# downscale an image so it fits into max_size x max_size pixels and re-encode
+# it, runs in a worker process; the original is returned when Pillow can't
+# read it, it's animated or the result wouldn't be smaller
+def optimizeImage(file_name, data, max_size=1600, fmt="webp", quality=80):
+    if Image is None:
+        return file_name, data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, "is_animated", False):
+                return file_name, data
+            image.load()
+            if max_size:
+                image.thumbnail((max_size, max_size))
+            if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+                # no transparency in jpeg, put the image on a white background
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            out = io.BytesIO()
+            image.save(out, format=fmt.upper(), quality=quality)
+    except Exception:
+        return file_name, data
+    if out.tell() >= len(data):
+        return file_name, data
+    return optimizedName(file_name, fmt), out.getvalue()
+
+# the pool re-encoding images of an import run; worker processes are started
+# with spawn, Anki's process has threads and a Qt event loop that mustn't be
+# forked; when Anki's executable can't start workers it falls back to threads
+class ImageOptimizer:
+
+    def __init__(self, config):
+        self.max_size = config["image_max_size"]
+        self.format = config["image_format"]
+        self.quality = config["image_quality"]
+        self.workers = max(1, config["image_workers"])
+        self.executor = None
+
+    @staticmethod
+    def enabled(config):
+        return Image is not None and config["optimize_images"] and config["image_format"] in FORMAT_EXTENSIONS
+
+    def createPool(self):
+        if os.path.basename(sys.executable).lower().startswith("python"):
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def submit(self, file_name, data):
+        if self.executor is None:
+            self.executor = self.createPool()
+        try:
+            return self.executor.submit(optimizeImage, file_name, data, self.max_size, self.format, self.quality)
+        except BrokenProcessPool:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self.executor.submit(optimizeImage, file_name, data, self.max_size, self.format, self.quality)
+
+    # the file name the image is stored under in the collection when optimized
+    def fileName(self, file_name):
+        return optimizedName(file_name, self.format) if isImage(file_name) else file_name
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,622 @@
+import html, os, re, time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from anki.utils import checksum
+
+try:
+    from anki.collection import AddNoteRequest
+except ImportError:
+    AddNoteRequest = None
+
+from .cancel import sessionToken
+from .engine import AsyncEngine
+from .extract import extractFolderData, extractSetData
+from .imaging import ImageOptimizer, isImage
+from .media import MEDIA_FORMATS, downloadFile, mediaFileName, sameMedia
+from .network import fetchItemPages, fetchPage, fetchSetApiData, setPageUrl
+from .richtext import ankify, renderMany
+from .stats import ImportStats
+from .terms import iterTermPages
+
+# The fetch, parse and note building core of the importer. It only needs a
+# collection, so it is shared by the dialog and the headless batch mode.
+
+rich_text_css = """
+:root {
+  --yellow_light_background: #fff4e5;
+  --blue_light_background: #cde7fa;
+  --pink_light_background: #fde8ff;
+}
+
+.nightMode {
+  --yellow_light_background: #8c7620;
+  --blue_light_background: #295f87;
+  --pink_light_background: #7d537f;
+}
+
+.bgY {
+  background-color: var(--yellow_light_background) !important;
+}
+
+.bgB {
+  background-color: var(--blue_light_background) !important;
+}
+
+.bgP {
+  background-color: var(--pink_light_background) !important;
+}
+"""
+
+# notetypes that weren't created with a Quizlet ID field keep the ID in a
+# tag, adding a field to them would force a full sync
+QUIZLET_ID_TAG = "quizlet::"
+
+# add custom model if needed
+def addCustomModel(name, col, config):
+
+    # create custom model for imported deck
+    mm = col.models
+    existing = mm.by_name("Basic Quizlet")
+    if existing:
+        fields = mm.field_names(existing)
+        if "Front" in fields and "Back" in fields and "Image" in fields:
+            if not config["add_audio"] or ("Front Audio" in fields and "Back Audio" in fields):
+                return existing
+        else:
+            existing['name'] += "-" + checksum(str(time.time()))[:5]
+            mm.save(existing)
+    m = mm.new("Basic Quizlet")
+
+    # add fields
+    mm.add_field(m, mm.new_field("Front"))
+    mm.add_field(m, mm.new_field("Back"))
+    mm.add_field(m, mm.new_field("Image"))
+    mm.add_field(m, mm.new_field("Add Reverse"))
+    if config["add_audio"]:
+        mm.add_field(m, mm.new_field("Front Audio"))
+        mm.add_field(m, mm.new_field("Back Audio"))
+    # not used on the cards, it lets a re-import find the notes it created
+    mm.add_field(m, mm.new_field("Quizlet ID"))
+
+    # add cards
+    t = mm.new_template("Forward")
+
+    # front
+    if not config["add_audio"]:
+        t['qfmt'] = "{{Front}}"
+        t['afmt'] = "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}\n\n<div>{{Image}}</div>"
+    else:
+        t['qfmt'] = "{{Front}}\n\n{{#Front Audio}}\n<div>{{Front Audio}}</div>\n{{/Front Audio}}"
+        t['afmt'] = "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}\n\n{{#Back Audio}}<div>{{Back Audio}}</div>{{/Back Audio}}\n\n<div>{{Image}}</div>"
+    mm.addTemplate(m, t)
+
+    # back
+    t = mm.new_template("Reverse")
+    if not config["add_audio"]:
+        t['qfmt'] = "{{#Add Reverse}}\n\n{{Back}}\n\n<div>{{Image}}</div>\n\n{{/Add Reverse}}"
+        t['afmt'] = "{{FrontSide}}\n\n<hr id=answer>\n\n{{Front}}"
+    else:
+        t['qfmt'] = "{{#Add Reverse}}\n\n{{Back}}\n\n{{#Back Audio}}<div>{{Back Audio}}</div>{{/Back Audio}}\n\n<div>{{Image}}</div>\n\n{{/Add Reverse}}"
+        t['afmt'] = "{{FrontSide}}\n\n<hr id=answer>\n\n{{Front}}\n\n{{#Front Audio}}\n<div>{{Front Audio}}</div>\n{{/Front Audio}}"
+    mm.add_template(m, t)
+
+    m["css"] = """.card {
+    font-family: arial;
+    font-size: 20px;
+    line-height: 1.5;
+    text-align: center;
+    color: black;
+    background-color: white;
+}
+
+img {
+    margin-top: 1em;
+}
+"""
+
+    m["css"] += rich_text_css
+
+    if config["add_audio"]:
+        m["css"] += """
+.replay-button {
+    margin-top: 0.5em;
+}
+"""
+
+    mm.add(m)
+    return m
+
+def canAddInBulk(col):
+    return AddNoteRequest is not None and hasattr(col, "add_notes")
+
+# store the Quizlet ID in its field, or in a tag if the notetype has none
+def setQuizletId(note, quizletId):
+    if "Quizlet ID" in note:
+        note["Quizlet ID"] = quizletId
+    elif quizletId:
+        tag = QUIZLET_ID_TAG + quizletId
+        if tag not in note.tags:
+            note.tags.append(tag)
+
+# notes created by earlier imports of a set, keyed by their Quizlet ID
+def findImportedNotes(col, model, quizletDeckID):
+    names = col.models.field_names(model)
+    prefix = "{}-".format(quizletDeckID)
+    notes = {}
+    if "Quizlet ID" in names:
+        idx = names.index("Quizlet ID")
+        for nid, flds in col.db.execute("select id, flds from notes where mid = ?", model["id"]):
+            fields = flds.split("\x1f")
+            if idx < len(fields) and fields[idx].startswith(prefix):
+                notes[fields[idx]] = (nid, dict(zip(names, fields)))
+        return notes
+    # tags are stored space separated with a space on both ends
+    query = "select id, flds, tags from notes where mid = ? and tags like ?"
+    for nid, flds, tags in col.db.execute(query, model["id"], "% {}{}%".format(QUIZLET_ID_TAG, prefix)):
+        for tag in tags.split():
+            if tag.lower().startswith(QUIZLET_ID_TAG + prefix):
+                notes[tag[len(QUIZLET_ID_TAG):]] = (nid, dict(zip(names, flds.split("\x1f"))))
+    return notes
+
+# Front and Back without markup, case and spacing differences, for finding duplicates
+def duplicateKey(front, back):
+    return normalizeField(front), normalizeField(back)
+
+def normalizeField(text):
+    return " ".join(html.unescape(re.sub(r"<[^>]*>", " ", text)).split()).casefold()
+
+# the duplicate keys of all notes of the model in a deck, in a single query
+def findDuplicateKeys(col, model, deck_id):
+    names = col.models.field_names(model)
+    front, back = names.index("Front"), names.index("Back")
+    keys = set()
+    query = "select flds from notes where mid = ? and id in (select nid from cards where did = ?)"
+    for flds, in col.db.execute(query, model["id"], deck_id):
+        fields = flds.split("\x1f")
+        keys.add(duplicateKey(fields[front], fields[back]))
+    return keys
+
+# the set ID from a set url: the first group of digits in its path
+def parseSetId(urlPath):
+    quizletDeckID = urlPath.strip("/")
+    if quizletDeckID == "":
+        raise ValueError("Oops! Please use the full deck URL :(")
+    elif not bool(re.search(r'\d', quizletDeckID)):
+        raise ValueError("Oops! No deck ID found in path <i>{0}</i> :(".format(quizletDeckID))
+    # get first set of digits from url path
+    return re.search(r"\d+", quizletDeckID).group(0)
+
+# download a set page and pull out what the importer needs; with api the
+# json endpoints are tried first and the set page is only the fallback
+def downloadSetData(session, limiter, quizletDeckID, page_cache=None, refresh=False, stats=None, api=False):
+    stats = stats or ImportStats()
+    if api:
+        try:
+            with stats.phase("set api"):
+                return fetchSetApiData(session, limiter, quizletDeckID)
+        except CancelledError:
+            raise
+        except Exception:
+            stats.add("set api fallbacks")
+    url = setPageUrl(quizletDeckID)
+    with stats.phase("set page"):
+        body = fetchPage(session, limiter, url, page_cache, refresh)
+    sessionToken(session).check()
+    with stats.phase("extract"):
+        result = extractSetData(body, url)
+    # the paging token of a stored page may have expired, so a paged set
+    # always gets its page downloaded again
+    if pagingMeta(result) and page_cache and page_cache.wasReused(url):
+        with stats.phase("set page"):
+            body = fetchPage(session, limiter, url, page_cache, True)
+        sessionToken(session).check()
+        with stats.phase("extract"):
+            result = extractSetData(body, url)
+    return result
+
+# the paging info of a set whose terms don't all fit on the set page
+def pagingMeta(result):
+    try:
+        meta = result["setPage"]["pagingMeta"]
+    except (KeyError, TypeError):
+        return None
+    if meta and meta["total"] > meta["perPage"]:
+        return meta
+    return None
+
+# the items of a paged set that are already in the result, when they are a
+# whole first page of the paging requests, like the ones of the json api
+def firstPageItems(result):
+    meta = pagingMeta(result)
+    if meta and meta.get("page") == 1:
+        return result["studyModesCommon"]["studiableData"]["studiableItems"]
+    return None
+
+# folder name and the urls of the sets in a folder
+def downloadFolder(session, limiter, url, page_cache=None, refresh=False, stats=None):
+    stats = stats or ImportStats()
+    with stats.phase("folder page"):
+        body = fetchPage(session, limiter, url, page_cache, refresh)
+    models = extractFolderData(body)
+    del body
+
+    assert len(models["folder"]) == 1
+
+    quizletFolder = models["folder"][0]
+    setMap = { s["id"]:s for s in models["set"] }
+    return quizletFolder["name"], [setMap[folderSet["setId"]]["_webUrl"] for folderSet in models["folderStudyMaterial"]]
+
+# expand the urls into a plan of sets before anything is imported: folders
+# are downloaded concurrently and a set that is listed twice, or belongs to
+# several of the folders, is only kept under the first url it came from;
+# returns the (url_index, set url, parent deck) jobs and the number of
+# duplicates that were dropped
+def resolveSets(session, limiter, urls, parentDeck="", page_cache=None, refresh=False, stats=None, workers=4):
+    folders = list(dict.fromkeys(url for url in urls if "/folders/" in url))
+
+    def expand(url):
+        return downloadFolder(session, limiter, url, page_cache, refresh, stats)
+
+    token = sessionToken(session)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [executor.submit(expand, url) for url in folders]
+        expanded = dict(zip(folders, [token.result(future) for future in futures]))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    jobs = []
+    seen = set()
+    duplicates = 0
+    for url_index, url in enumerate(urls):
+        if url in expanded:
+            folderName, setUrls = expanded[url]
+            sets = [(setUrl, parentDeck or folderName) for setUrl in setUrls]
+        else:
+            sets = [(url, parentDeck)]
+        for setUrl, deck in sets:
+            try:
+                quizletDeckID = parseSetId(setUrl)
+            except ValueError:
+                # reported when the set is imported
+                quizletDeckID = None
+            if quizletDeckID in seen:
+                duplicates += 1
+                continue
+            if quizletDeckID:
+                seen.add(quizletDeckID)
+            jobs.append((url_index, setUrl, deck))
+    return jobs, duplicates
+
+
+# imports downloaded sets into a collection, the hooks at the top are
+# replaced by the dialog to keep Qt responsive while it waits
+class DeckImporter:
+
+    def __init__(self, col, config, session, limiter, media_cache=None, stats=None, journal=None, optimizer=None,
+                 backfill=None):
+        self.col = col
+        self.config = config
+        self.session = session
+        self.limiter = limiter
+        self.media_cache = media_cache
+        self.stats = stats or ImportStats()
+        self.journal = journal
+        # text first: media that isn't in the collection yet is queued for later
+        self.backfill = backfill
+        # images are re-encoded by a pool shared by the whole run, or one of its own
+        self.optimizer = optimizer
+        self.own_optimizer = optimizer is None and ImageOptimizer.enabled(config)
+        if self.own_optimizer:
+            self.optimizer = ImageOptimizer(config)
+        # changes of the last collection operation, for the caller to refresh the UI
+        self.changes = None
+        # cancels the import along with the requests of its session
+        self.token = sessionToken(session)
+
+    def progress(self, text):
+        pass
+
+    # pages of studiable items, consumed as they arrive
+    def iterPages(self, pages):
+        return pages
+
+    # wait until at least one of the futures is done, or the import is cancelled
+    def waitAny(self, pending):
+        return self.token.wait(pending)
+
+    # run a collection operation and return its result
+    def runOp(self, op):
+        return op(self.col)
+
+    # create the deck of a downloaded set, the counts of added, updated and
+    # unchanged notes are stored in the result; a cancelled import raises
+    # ImportCancelled between two pages, the pages added so far are complete
+    # notes and an import resumed from the journal adds the rest
+    def importSet(self, result, quizletDeckID, parentDeck=""):
+        try:
+            return self.createDeck(result, quizletDeckID, parentDeck)
+        finally:
+            if self.own_optimizer:
+                self.optimizer.shutdown()
+
+    def createDeck(self, result, quizletDeckID, parentDeck=""):
+        # create new deck and custom model
+        if "set" in result:
+            name = result['set']['title']
+        elif "studyable" in result:
+            name = result['studyable']['title']
+        else:
+            name = result['title']
+
+        if parentDeck:
+            name = "{}::{}".format(parentDeck, name)
+
+        meta = pagingMeta(result)
+        if meta:
+            # the set page only has the first terms, the rest comes page by page
+            first_items = firstPageItems(result)
+            result.pop("studyModesCommon", None)
+            total = meta["total"]
+            pages = self.iterPages(fetchItemPages(self.session, self.limiter, meta, quizletDeckID,
+                                                  self.config["paging_workers"], self.config["max_retries"],
+                                                  self.journal, first_items))
+        elif "studyModesCommon" in result:
+            items = result["studyModesCommon"]["studiableData"]["studiableItems"]
+            total = len(items)
+            pages = [items]
+        else:
+            raise Exception('NO MATCH\n\n' + str(result))
+
+        deck = self.col.decks.get(self.col.decks.id(name))
+        model = addCustomModel(name, self.col, self.config)
+
+        # assign custom model to new deck
+        self.col.decks.select(deck["id"])
+        self.col.decks.save(deck)
+
+        # assign new deck to custom model
+        self.col.models.set_current(model)
+        model["did"] = deck["id"]
+        self.col.models.save(model)
+
+        def quizletId(term):
+            return "{}-{}".format(quizletDeckID, term.id) if term.id else ''
+
+        # both sides of all terms of a page are rendered in one batch
+        def pageTexts(terms):
+            sides = []
+            for term in terms:
+                sides.append(ankify(term.word))
+                sides.append(ankify(term.definition))
+            if self.config["rich_text_formatting"]:
+                rich = []
+                for term in terms:
+                    rich.append(term.wordRichText)
+                    rich.append(term.definitionRichText)
+                sides = renderMany(zip(rich, sides))
+            return {term: {"Front": sides[2 * i], "Back": sides[2 * i + 1]} for i, term in enumerate(terms)}
+
+        texts = {}
+
+        def noteText(term):
+            return texts[term]
+
+        def noteMedia(term):
+            media = {"Image": term.imageUrl}
+            if self.config["add_audio"]:
+                media["Front Audio"] = term.wordTTS
+                media["Back Audio"] = term.definitionTTS
+            return media
+
+        def fillNote(note, term, fields, media_files):
+            for k, v in noteText(term).items():
+                note[k] = v
+            media = noteMedia(term)
+            for k in fields:
+                file_name = media_files.get(media[k])
+                note[k] = MEDIA_FORMATS[k].format(file_name) if file_name else ''
+            setQuizletId(note, quizletId(term))
+            if self.config["add_reverse"]:
+                note["Add Reverse"] = "y"
+
+        # notes from earlier imports of this set, only the differences are applied;
+        # a resumed run always looks them up, so it doesn't add the same notes twice
+        imported = {}
+        if self.config["update_existing"] or (self.journal and self.journal.resumed):
+            imported = findImportedNotes(self.col, model, quizletDeckID)
+
+        # new terms that are already in the deck are skipped, and so is their media
+        duplicates = None
+        if self.config["skip_duplicates"]:
+            with self.stats.phase("duplicate index"):
+                duplicates = findDuplicateKeys(self.col, model, deck["id"])
+
+        result.update(term_count=0, added=0, updated=0, unchanged=0, duplicates=0)
+        # every page of terms is turned into notes as soon as it arrives,
+        # the pages share an undo entry while nothing else happens in between
+        undo_entry = []
+        for terms in self.stats.timed("paging", iterTermPages(pages)):
+            self.token.check()
+            result['term_count'] += len(terms)
+            texts = pageTexts(terms)
+
+            # sort the terms into new and changed ones and collect the media
+            # urls that are needed, so they can be downloaded in parallel
+            media_urls = []
+            new_terms = []
+            changed_terms = []
+            for term in terms:
+                media = noteMedia(term)
+                if quizletId(term) in imported:
+                    nid, fields = imported[quizletId(term)]
+                    text = noteText(term)
+                    changed_media = [k for k, url in media.items() if not sameMedia(fields.get(k, ''), url)]
+                    if all(fields[k] == v for k, v in text.items()) and not changed_media:
+                        result['unchanged'] += 1
+                        continue
+                    changed_terms.append((nid, term, changed_media))
+                    media_urls.extend(media[k] for k in changed_media)
+                else:
+                    if duplicates is not None:
+                        text = noteText(term)
+                        key = duplicateKey(text["Front"], text["Back"])
+                        if key in duplicates:
+                            result['duplicates'] += 1
+                            continue
+                        duplicates.add(key)
+                    new_terms.append(term)
+                    media_urls.extend(media.values())
+
+            media_files = self.downloadMedia(media_urls)
+            # nothing of a page is added once the import was cancelled
+            self.token.check()
+
+            notes = []
+            filled = []
+            for term in new_terms:
+                note = self.col.newNote()
+                fillNote(note, term, noteMedia(term).keys(), media_files)
+                notes.append(note)
+                filled.append((note, term, noteMedia(term).keys()))
+
+            updated_notes = []
+            for nid, term, changed_media in changed_terms:
+                note = self.col.get_note(nid)
+                fillNote(note, term, changed_media, media_files)
+                updated_notes.append(note)
+                filled.append((note, term, changed_media))
+
+            with self.stats.phase("notes"):
+                self.addNotes(notes, deck["id"], updated_notes, undo_entry)
+
+            if self.backfill is not None:
+                # the notes have their ids now, their missing media comes later
+                for note, term, fields in filled:
+                    media = noteMedia(term)
+                    for k in fields:
+                        if media[k] and not media_files.get(media[k]):
+                            self.backfill.add(note.id, k, media[k])
+                self.backfill.save()
+            result['added'] += len(notes)
+            result['updated'] += len(updated_notes)
+            if self.journal:
+                self.journal.save()
+
+            done = result['added'] + result['updated'] + result['unchanged'] + result['duplicates']
+            self.progress("Importing deck {} [{}/{}] ...".format(name, done, total))
+
+        return deck["id"]
+
+    # add and update notes in one collection operation, the changes are merged
+    # into the undo entry of the earlier calls that received the same undo_entry
+    # list, as long as that entry is still the last undo step
+    def addNotes(self, notes, deck_id, updated_notes=(), undo_entry=None):
+        if not canAddInBulk(self.col):
+            # older Anki versions
+            def add(col):
+                for note in updated_notes:
+                    note.flush()
+                for note in notes:
+                    col.addNote(note)
+            self.runOp(add)
+            return
+
+        note_requests = [AddNoteRequest(note=note, deck_id=deck_id) for note in notes]
+        if undo_entry is None:
+            undo_entry = []
+
+        def apply(col):
+            # the user may have changed something since the last page, then
+            # the rest of the set gets an undo entry of its own
+            if not undo_entry or col.undo_status().last_step != undo_entry[0]:
+                undo_entry[:] = [col.add_custom_undo_entry("Import from Quizlet")]
+            if updated_notes:
+                col.update_notes(updated_notes)
+            if note_requests:
+                col.add_notes(note_requests)
+            return col.merge_undo_entries(undo_entry[0])
+
+        self.changes = self.runOp(apply)
+
+    # download all media of a set in parallel, the files are written to the
+    # collection from the calling thread
+    def downloadMedia(self, urls):
+        media_files = {}
+        urls = list(dict.fromkeys(url for url in urls if url))
+        # files already in the collection need no download at all
+        media_dir = self.col.media.dir()
+        for url in urls:
+            file_name = (self.journal and self.journal.mediaFile(url)) or mediaFileName(url)[1]
+            names = [file_name]
+            if self.optimizer:
+                names.insert(0, self.optimizer.fileName(file_name))
+            for name in names:
+                if os.path.exists(os.path.join(media_dir, name)):
+                    media_files[url] = name
+                    break
+        self.stats.add("collection media hits", len(media_files))
+        urls = [url for url in urls if url not in media_files]
+        if not urls or self.backfill is not None:
+            return media_files
+        with self.stats.phase("media"):
+            return self.fetchMedia(urls, media_files)
+
+    def fetchMedia(self, urls, media_files):
+        executor = ThreadPoolExecutor(max_workers=max(1, self.config["media_workers"]))
+        futures = {self.submitFile(executor, url): url for url in urls}
+        pending = set(futures)
+        # images being re-encoded, they are written once that's done
+        optimizing = {}
+        written = 0
+        try:
+            while pending:
+                done, pending = self.waitAny(pending)
+                for future in done:
+                    if future in optimizing:
+                        url, file_name, data = optimizing.pop(future)
+                        file_name, data = self.optimized(future, file_name, data)
+                    else:
+                        url = futures[future]
+                        file_name, data = future.result()
+                        if data is not None and self.optimizer and isImage(file_name):
+                            job = self.optimizer.submit(file_name, data)
+                            optimizing[job] = (url, file_name, data)
+                            pending.add(job)
+                            continue
+                    if data is not None:
+                        file_name = self.col.media.write_data(file_name, data)
+                        if self.journal:
+                            self.journal.addMedia(url, file_name)
+                    else:
+                        file_name = ''
+                    media_files[url] = file_name
+                    written += 1
+                self.progress("Downloading media [{}/{}] ...".format(written, len(futures)))
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+        return media_files
+
+    # the re-encoded image, or the original one if that failed
+    def optimized(self, future, file_name, data):
+        try:
+            new_name, new_data = future.result()
+        except Exception:
+            return file_name, data
+        if new_name != file_name:
+            self.stats.add("images optimized")
+            self.stats.add("image bytes saved", len(data) - len(new_data))
+        return new_name, new_data
+
+    # media files go straight to the async engine, otherwise to the worker threads
+    def submitFile(self, executor, url):
+        if isinstance(self.session, AsyncEngine):
+            return self.session.submitFile(url, self.media_cache)
+        return executor.submit(self.fileDownloader, url)
+
+    # download the images, runs in a worker thread so it must not touch the collection
+    def fileDownloader(self, url):
+        with self.stats.phase("media files (all workers)"):
+            return downloadFile(self.session, url, self.media_cache)
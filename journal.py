@@ -0,0 +1,112 @@
+import hashlib, json, os, shutil, threading, time
+
+# checkpoints of an import run, so an interrupted run of the same url list
+# picks up where it stopped: the sets resolved from the urls, the sets that
+# were finished, the pages of studiable items fetched so far and the media
+# files written to the collection
+class ImportJournal:
+
+    # journals of runs that were interrupted this long ago are removed, their
+    # folder plans and finished sets are out of date by then
+    max_age = 3 * 24 * 3600
+
+    def __init__(self, path, urls, parentDeck=""):
+        os.makedirs(path, exist_ok=True)
+        self.prune(path)
+        key = json.dumps([urls, parentDeck], ensure_ascii=False)
+        self.path = os.path.join(path, hashlib.sha1(key.encode("utf-8")).hexdigest())
+        self.pages_path = os.path.join(self.path, "pages")
+        self.journal_path = os.path.join(self.path, "journal.json")
+        self.lock = threading.Lock()
+        os.makedirs(self.pages_path, exist_ok=True)
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.resumed = bool(self.data)
+        self.data.setdefault("jobs", None)
+        self.data.setdefault("sets", {})
+        self.data.setdefault("pages", {})
+        self.data.setdefault("media", {})
+
+    @classmethod
+    def prune(cls, path):
+        now = time.time()
+        for name in os.listdir(path):
+            journal_dir = os.path.join(path, name)
+            try:
+                if now - os.path.getmtime(os.path.join(journal_dir, "journal.json")) <= cls.max_age:
+                    continue
+            except OSError:
+                # no checkpoint was ever saved, go by the directory itself
+                try:
+                    if now - os.path.getmtime(journal_dir) <= cls.max_age:
+                        continue
+                except OSError:
+                    continue
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+    def save(self):
+        with self.lock:
+            with open(self.journal_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(self.journal_path + ".tmp", self.journal_path)
+
+    # the run went through, nothing is left to resume
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def jobs(self):
+        return self.data["jobs"]
+
+    def setJobs(self, jobs):
+        self.data["jobs"] = jobs
+        self.save()
+
+    # the counts of a set that was imported before, or None
+    def finishedSet(self, setId):
+        return self.data["sets"].get(str(setId))
+
+    def finishSet(self, setId, result):
+        with self.lock:
+            self.data["sets"][str(setId)] = result
+            self.data["pages"].pop(str(setId), None)
+        self.save()
+
+    def pagePath(self, setId, page):
+        return os.path.join(self.pages_path, "{}-{}.json".format(setId, page))
+
+    # a page of studiable items fetched before, the paging token is only valid
+    # for a while, so the pages are matched by number and the set total
+    def getPage(self, setId, total, page):
+        with self.lock:
+            entry = self.data["pages"].get(str(setId))
+            if not entry or entry["total"] != total or page not in entry["pages"]:
+                return None
+        try:
+            with open(self.pagePath(setId, page), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def putPage(self, setId, total, token, page, items):
+        path = self.pagePath(setId, page)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        os.replace(path + ".tmp", path)
+        with self.lock:
+            entry = self.data["pages"].get(str(setId))
+            if not entry or entry["total"] != total:
+                entry = self.data["pages"][str(setId)] = {"total": total, "pages": []}
+            entry["token"] = token
+            if page not in entry["pages"]:
+                entry["pages"].append(page)
+
+    # the name a media file was written under, write_data renames files on conflicts
+    def mediaFile(self, url):
+        return self.data["media"].get(url)
+
+    def addMedia(self, url, file_name):
+        with self.lock:
+            self.data["media"][url] = file_name
@@ -0,0 +1,44 @@
+import os, re
+
+# how a media file is referenced by each media field of a note
+MEDIA_FORMATS = {
+    "Image": '<img src="{}">',
+    "Front Audio": '[sound:{}]',
+    "Back Audio": '[sound:{}]',
+}
+
+# file name of a downloaded image or TTS file and the url to get it from
+def mediaFileName(url):
+    if '/tts/' in url:
+        m = re.search(r'tts/(\w+)\.mp3\?.*&s=([^&]+)', url)
+        file_name = "quizlet-" + m.group(1) + '-' + m.group(2) + ".mp3"
+    else:
+        # get original, non-mobile version of images
+        url = url.replace('_m', '')
+        file_name = "quizlet-" + url.split('/')[-1]
+    return url, file_name
+
+# whether a media field still refers to the file behind the url,
+# write_data may have added a checksum to the name so compare the stem
+def sameMedia(value, url):
+    if not url:
+        return not value
+    file_name = mediaFileName(url)[1]
+    return bool(value) and os.path.splitext(file_name)[0] in value
+
+# download an image or TTS file, this runs in worker threads so it must not
+# touch the collection; returns the file name and the content or None; the
+# session of an import run brings its request policy for retries and hedging
+def downloadFile(session, url, cache=None):
+    if cache:
+        cached = cache.get(url)
+        if cached:
+            return cached
+    download_url, file_name = mediaFileName(url)
+    policy = getattr(session, "policy", None)
+    r = policy.get(session, download_url) if policy else session.get(download_url)
+    if r is not None and r.status_code == 200:
+        if cache:
+            cache.put(url, file_name, r.content)
+        return file_name, r.content
+    return file_name, None
@@ -0,0 +1,263 @@
+import math, random, time, threading
+from collections import deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from curl_cffi import CurlOpt
+from curl_cffi import requests as curl_requests
+
+from .cancel import sessionToken
+
+# browser profile used for every request to Quizlet
+IMPERSONATE = "chrome"
+
+# can be pointed at a local stand-in server, see bench/
+QUIZLET_URL = "https://quizlet.com"
+
+# seconds to wait for a connection and for the response, a stalled transfer
+# is given up on instead of freezing the import
+def timeouts(config):
+    return (config["connect_timeout"], config["http_timeout"])
+
+# exponential backoff with jitter, so workers that failed together don't all
+# come back at the same moment
+def retryDelay(attempt, base=0.5, cap=8.0):
+    delay = min(cap, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+# one long-lived session per import run, so connections, TLS sessions and
+# HTTP/2 streams are reused by the set pages, paging requests and media files;
+# curl handles are thread-local, so the session can be shared by worker threads
+def createSession(config, cookies=None):
+    return curl_requests.Session(
+        impersonate=IMPERSONATE,
+        cookies=cookies or {},
+        timeout=timeouts(config),
+        curl_options={CurlOpt.MAXCONNECTS: config["max_connections"]},
+    )
+
+# token bucket shared by every request to quizlet.com during an import run,
+# the rate is halved when Quizlet starts throttling or shows a captcha and
+# grows back step by step while requests keep succeeding, but never beyond
+# the configured rate; requests that aren't paced, like the json paging
+# requests, only wait for a token while the rate is backed off
+class RateLimiter:
+
+    def __init__(self, rate=2.0, min_rate=0.2):
+        self.rate = float(rate)
+        self.min_rate = min(min_rate, self.rate)
+        self.max_rate = self.rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # the wait for a token ends early when the run is cancelled
+    def acquire(self, token=None, paced=True):
+        while True:
+            with self.lock:
+                if not paced and self.rate >= self.max_rate:
+                    return
+                now = time.monotonic()
+                capacity = max(1.0, self.rate)
+                self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            if token:
+                token.sleep(delay)
+            else:
+                time.sleep(delay)
+
+    def backoff(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            # drain the bucket so nobody gets through right after a block
+            self.tokens = min(self.tokens, 0.0)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+# too many requests or a captcha challenge, a plain 403 is a private set
+def isThrottled(r):
+    return r.status_code == 429 or "CF-Chl-Bypass" in r.headers
+
+# GET a Quizlet page through the rate limiter, too many requests and
+# captcha challenges are retried once the limiter has slowed down, timeouts
+# and dropped connections after a jittered backoff; requests that aren't
+# paced only wait while the limiter is backed off
+def quizletGet(session, limiter, url, retries=2, paced=True, **kwargs):
+    token = sessionToken(session)
+    for attempt in range(retries + 1):
+        limiter.acquire(token, paced)
+        try:
+            r = session.get(url, **kwargs)
+        except curl_requests.RequestsError:
+            if attempt == retries:
+                raise
+            token.sleep(retryDelay(attempt))
+            continue
+        if not isThrottled(r):
+            limiter.success()
+            return r
+        limiter.backoff()
+    return r
+
+def setPageUrl(setId):
+    return "{}/{}/flashcards".format(QUIZLET_URL, setId)
+
+STUDIABLE_ITEMS_URL = (
+    '{base}/webapi/3.4/studiable-item-documents'
+    '?pagingToken={token}&page={page}&perPage={perPage}'
+    '&filters%5BstudiableContainerId%5D={setId}&filters%5BstudiableContainerType%5D=1'
+)
+
+FIRST_ITEMS_URL = (
+    '{base}/webapi/3.4/studiable-item-documents'
+    '?page=1&perPage={perPage}'
+    '&filters%5BstudiableContainerId%5D={setId}&filters%5BstudiableContainerType%5D=1'
+)
+
+SET_URL = '{base}/webapi/3.4/sets/{setId}'
+
+ITEMS_PER_PAGE = 100
+
+# download one page of studiable items, a failed, short or empty page is
+# retried on its own, after the last retry whatever was received is returned
+def fetchItemsPage(session, limiter, token, setId, page, expected, retries=2):
+    url = STUDIABLE_ITEMS_URL.format(base=QUIZLET_URL, token=token, page=page, perPage=ITEMS_PER_PAGE, setId=setId)
+    cancel = sessionToken(session)
+    for attempt in range(retries + 1):
+        try:
+            # the paging requests of a set go out concurrently, only the set
+            # and folder pages keep to the configured rate
+            r = quizletGet(session, limiter, url, paced=False)
+            r.raise_for_status()
+            items = []
+            for resp in r.json()["responses"]:
+                items.extend(resp["models"]["studiableItem"])
+            if len(items) >= expected or attempt == retries:
+                return items
+        except CancelledError:
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+        cancel.sleep(retryDelay(attempt))
+
+# title and first page of terms of a set straight from the json api, a few
+# kilobytes instead of the set page html; the result looks like the one of
+# extract.extractSetData, a ValueError means the html has to be used instead
+def fetchSetApiData(session, limiter, setId):
+    r = quizletGet(session, limiter, SET_URL.format(base=QUIZLET_URL, setId=setId))
+    r.raise_for_status()
+    sets = [s for resp in r.json()["responses"] for s in resp["models"].get("set", [])]
+    if not sets:
+        raise ValueError("no set in the api response")
+    title = sets[0]["title"]
+
+    r = quizletGet(session, limiter, FIRST_ITEMS_URL.format(base=QUIZLET_URL, perPage=ITEMS_PER_PAGE, setId=setId))
+    r.raise_for_status()
+    items = []
+    paging = None
+    for resp in r.json()["responses"]:
+        items.extend(resp["models"]["studiableItem"])
+        paging = paging or resp.get("paging")
+
+    result = {
+        "set": {"title": title},
+        "title": title,
+        "studyModesCommon": {"studiableData": {"studiableItems": items}},
+    }
+    if paging and paging["total"] > len(items):
+        meta = {"total": paging["total"], "perPage": len(items), "token": paging["token"]}
+        if len(items) == ITEMS_PER_PAGE:
+            # a full first page, paging goes on from the second one
+            meta["page"] = 1
+        result["setPage"] = {"pagingMeta": meta}
+    elif not paging and len(items) >= ITEMS_PER_PAGE:
+        raise ValueError("no paging info in the api response")
+    return result
+
+# the total and the page size are known from the set page, so the pages are
+# fetched concurrently and handed out in page order as soon as they arrive;
+# only a few pages are kept in flight ahead of the one being consumed; pages
+# already in the journal of an interrupted run aren't fetched again, and
+# neither is the first page when its items are passed in
+def fetchItemPages(session, limiter, meta, setId, workers=4, retries=2, journal=None, first_items=None):
+    total = meta["total"]
+    pages = max(1, math.ceil(total / ITEMS_PER_PAGE))
+    workers = max(1, workers)
+
+    def fetch(page, expected=None):
+        if journal:
+            items = journal.getPage(setId, total, page)
+            if items is not None:
+                return items
+        if expected is None:
+            expected = min(ITEMS_PER_PAGE, total - (page - 1) * ITEMS_PER_PAGE)
+        items = fetchItemsPage(session, limiter, meta["token"], setId, page, expected, retries)
+        if journal and items:
+            journal.putPage(setId, total, meta["token"], page, items)
+        return items
+
+    count = 0
+    next_page = 1
+    if first_items is not None:
+        count += len(first_items)
+        next_page = 2
+        yield first_items
+
+    cancel = sessionToken(session)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = deque()
+        while futures or next_page <= pages:
+            while next_page <= pages and len(futures) < 2 * workers:
+                futures.append(executor.submit(fetch, next_page))
+                next_page += 1
+            items = cancel.result(futures.popleft())
+            count += len(items)
+            yield items
+    finally:
+        # on a cancel the pages still being fetched aren't waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # terms were added or pages came back short, keep going like before
+    page = pages
+    while count < total:
+        page += 1
+        items = fetch(page, 0)
+        if not items:
+            break
+        count += len(items)
+        yield items
+
+# body of a set or folder page, served from the page cache while it's fresh
+# and revalidated with a conditional request once it's not
+def fetchPage(session, limiter, url, cache=None, refresh=False):
+    entry = cache.get(url) if cache else None
+    if entry and not refresh and cache.isFresh(entry):
+        cache.count("hits")
+        cache.reuse(url)
+        return entry["body"]
+
+    headers = {}
+    if entry and not refresh:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    r = quizletGet(session, limiter, url, headers=headers)
+    if headers and r.status_code == 304:
+        cache.count("revalidated")
+        cache.reuse(url)
+        cache.touch(url, entry)
+        return entry["body"]
+    r.raise_for_status()
+    if cache:
+        cache.count("misses")
+        cache.put(url, r.content, r.headers)
+    return r.content
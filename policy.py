@@ -0,0 +1,128 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from curl_cffi.requests import RequestsError
+
+from .cancel import sessionToken
+from .network import retryDelay
+
+# responses that may well be different when asked again
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+
+# media requests aren't hedged before they took at least this long, nor
+# before there are enough latencies for a meaningful p95
+MIN_HEDGE_DELAY = 0.25
+MIN_SAMPLES = 20
+
+# latencies of the latest successful media requests
+class LatencyTracker:
+
+    def __init__(self, size=500):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p):
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+# how media files are requested: failed transfers and server errors are
+# retried a few times with jittered backoff, and a request that takes longer
+# than 95% of the recent ones gets a duplicate, whichever finishes first wins;
+# media GETs are idempotent so asking twice is harmless. Media that still
+# fail are recorded with the reason in the stats of the run
+class RequestPolicy:
+
+    def __init__(self, config, stats):
+        self.retries = max(0, config["max_retries"])
+        self.hedge = config["hedge_requests"]
+        # every media worker may have a request and its duplicate running
+        self.workers = 2 * max(1, config["media_workers"])
+        self.stats = stats
+        self.latency = LatencyTracker()
+        self.executor = None
+        self.lock = threading.Lock()
+
+    # seconds to wait before a duplicate request is sent, None when it isn't
+    def hedgeDelay(self):
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(0.95)
+        if p95 is None:
+            return None
+        return max(MIN_HEDGE_DELAY, p95)
+
+    def retryable(self, r):
+        return r.status_code in RETRY_STATUS
+
+    # curl's own transfer time, without the time spent waiting for a worker
+    def record(self, r):
+        if r.status_code == 200:
+            self.latency.record(r.elapsed.total_seconds())
+        return r
+
+    def fail(self, url, reason):
+        self.stats.addFailedMedia(url, reason)
+
+    # GET a media file from a worker thread; returns the last response, or
+    # None when every attempt failed with a transfer error
+    def get(self, session, url):
+        token = sessionToken(session)
+        reason = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.add("media retries")
+                token.sleep(retryDelay(attempt - 1))
+            try:
+                r = self.hedged(session, url, token)
+            except RequestsError as e:
+                reason = str(e) or type(e).__name__
+                continue
+            if self.retryable(r) and attempt < self.retries:
+                continue
+            if r.status_code != 200:
+                self.fail(url, "HTTP {}".format(r.status_code))
+            return r
+        self.fail(url, reason)
+        return None
+
+    def timedGet(self, session, url):
+        return self.record(session.get(url))
+
+    # a blocking transfer can't be aborted, the slower of the two requests
+    # runs to its end in the hedging thread, bounded by the timeouts
+    def hedged(self, session, url, token):
+        delay = self.hedgeDelay()
+        if delay is None:
+            return self.timedGet(session, url)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="quizlet-hedge")
+        first = self.executor.submit(self.timedGet, session, url)
+        done, pending = token.wait([first], timeout=delay)
+        if done:
+            return first.result()
+        self.stats.add("hedged requests")
+        second = self.executor.submit(self.timedGet, session, url)
+        done, pending = token.wait([first, second])
+        future = done.pop()
+        if future.exception() is not None and pending:
+            # the other one may still get through
+            future = pending.pop()
+            token.wait([future])
+        elif future is second:
+            self.stats.add("hedges won")
+        return future.result()
+
+    def close(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
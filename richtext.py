@@ -0,0 +1,126 @@
+import re
+
+# html of the ProseMirror style rich text of Quizlet terms. The tree is walked
+# with an explicit stack into a single list of string pieces, the opening and
+# closing tags of every combination of marks are built once and cached.
+
+rich_text_css_light_background_colors = {
+    "bgY": "#fff4e5",
+    "bgB": "#cde7fa",
+    "bgP": "#fde8ff"
+}
+
+rich_text_css_dark_background_colors = {
+    "bgY": "#8c7620",
+    "bgB": "#295f87",
+    "bgP": "#7d537f",
+}
+
+BOLD_RE = re.compile(r'\*(.+?)\*')
+
+# a node without content renders as a line break
+EMPTY_CONTENT = ('',)
+
+# marks -> (opening tags, closing tags)
+mark_tags = {}
+MAX_MARK_TAGS = 10000
+
+# the tags a single mark wraps its text in
+def markTag(m):
+    opening = closing = ''
+    if m['type'] in ['b', 'i', 'u']:
+        opening = '<{}>'.format(m['type'])
+        closing = '</{}>'.format(m['type'])
+    if 'attrs' in m:
+        attrs = " ".join(['{}="{}"'.format(k, v) for k, v in m['attrs'].items()])
+        if "class" in m['attrs']:
+            light_color = rich_text_css_light_background_colors.get(m['attrs']['class'], '')
+            dark_color = rich_text_css_dark_background_colors.get(m['attrs']['class'], '')
+        else:
+            light_color = ''
+        if light_color:
+            opening = '<span {} style="background-color: light-dark({}, {});">'.format(attrs, light_color, dark_color) + opening
+        else:
+            opening = '<span {}>'.format(attrs) + opening
+        closing += '</span>'
+    return opening, closing
+
+# every mark wraps the text produced by the marks before it
+def markTags(marks):
+    try:
+        key = tuple((m['type'], tuple(m['attrs'].items()) if 'attrs' in m else None) for m in marks)
+        cached = mark_tags.get(key)
+    except TypeError:
+        # attribute values that can't be hashed, nothing to cache
+        key = cached = None
+    if cached:
+        return cached
+    opening = closing = ''
+    for m in marks:
+        o, c = markTag(m)
+        opening = o + opening
+        closing = closing + c
+    if key is not None:
+        if len(mark_tags) >= MAX_MARK_TAGS:
+            mark_tags.clear()
+        mark_tags[key] = (opening, closing)
+    return opening, closing
+
+# append the html of a rich text tree to out
+def renderInto(root, out):
+    append = out.append
+    stack = [root]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        d = pop()
+        if d.__class__ is str:
+            # a closing tag or a line break pushed earlier
+            append(d)
+            continue
+        if d['type'] == 'text':
+            marks = d.get('marks')
+            if marks:
+                opening, closing = markTags(marks)
+                append(opening)
+                append(d['text'])
+                append(closing)
+            else:
+                append(d['text'])
+            continue
+        if d['type'] == 'paragraph':
+            append('<div>')
+            push('</div>')
+        for c in reversed(d.get('content', EMPTY_CONTENT)):
+            push(c if c else '<br>')
+
+# html of a rich text tree, text when there is none
+def renderRichText(d, text=''):
+    if not d:
+        return text
+    out = []
+    renderInto(d, out)
+    return ''.join(out)
+
+# render many trees into one buffer, e.g. both sides of a page of terms;
+# docs are (rich text, fallback text) pairs
+def renderMany(docs):
+    out = []
+    ends = []
+    for d, text in docs:
+        if d:
+            renderInto(d, out)
+        else:
+            out.append(text)
+        ends.append(len(out))
+    html = []
+    start = 0
+    for end in ends:
+        html.append(''.join(out[start:end]))
+        start = end
+    return html
+
+# the plain text of a term as html, *bold* is Quizlet's markup for bold text
+def ankify(text):
+    text = text.replace('\n', '<br>')
+    return BOLD_RE.sub(r'<b>\1</b>', text)
@@ -0,0 +1,103 @@
+import json, threading, time
+from contextlib import contextmanager
+
+# durations, transfers and cache hits of one import run; phases that run in
+# worker threads add up their time, so they can exceed the wall time
+class ImportStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.sets = []
+        # url -> why the file couldn't be downloaded
+        self.failed_media = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+
+    # time spent waiting for every item of an iterator
+    def timed(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.addTime(name, time.perf_counter() - start)
+                return
+            self.addTime(name, time.perf_counter() - start)
+            yield item
+
+    def addTime(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def addSet(self, **info):
+        with self.lock:
+            self.sets.append(info)
+
+    def addFailedMedia(self, url, reason):
+        with self.lock:
+            self.failed_media[url] = reason
+            self.counters["media failed"] = len(self.failed_media)
+
+    def wallTime(self):
+        return time.time() - self.started
+
+    def summary(self):
+        parts = ["{} {:.1f}s".format(name, seconds) for name, seconds in self.phases.items()]
+        parts.append("{} requests".format(self.counters.get("requests", 0)))
+        parts.append("{:.1f} MB".format(self.counters.get("bytes", 0) / 1024 / 1024))
+        hits = sum(v for k, v in self.counters.items() if k.endswith("hits"))
+        parts.append("{} cache hits".format(hits))
+        if "image bytes saved" in self.counters:
+            parts.append("{:.1f} MB saved on images".format(self.counters["image bytes saved"] / 1024 / 1024))
+        if self.failed_media:
+            parts.append("{} media failed".format(len(self.failed_media)))
+        return "Total {:.1f}s: {}".format(self.wallTime(), ", ".join(parts))
+
+    def toJson(self):
+        with self.lock:
+            return json.dumps({
+                "started": self.started,
+                "wall_time": self.wallTime(),
+                "phases": self.phases,
+                "counters": self.counters,
+                "sets": self.sets,
+                "failed_media": self.failed_media,
+            }, indent=2)
+
+# session wrapper that counts requests and downloaded bytes, media files
+# are requested through the policy when there is one; no new request is
+# started once the token of the run is cancelled
+class InstrumentedSession:
+
+    def __init__(self, session, stats, policy=None, token=None):
+        self.session = session
+        self.stats = stats
+        self.policy = policy
+        self.token = token
+
+    def get(self, url, **kwargs):
+        if self.token:
+            self.token.check()
+        r = self.session.get(url, **kwargs)
+        self.stats.add("requests")
+        self.stats.add("bytes", len(r.content))
+        return r
+
+    def close(self):
+        if self.policy:
+            self.policy.close()
+        self.session.close()
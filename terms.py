@@ -0,0 +1,36 @@
+# compact record of a single term, the sides of a studiable item are
+# normalized into a fixed set of slots instead of a dict per term
+class Term:
+
+    __slots__ = ("id", "word", "definition", "wordRichText", "definitionRichText",
+                 "wordTTS", "definitionTTS", "imageUrl")
+
+    def __init__(self, id=''):
+        self.id = id
+        self.word = ''
+        self.definition = ''
+        self.wordRichText = ''
+        self.definitionRichText = ''
+        self.wordTTS = ''
+        self.definitionTTS = ''
+        self.imageUrl = ''
+
+    @classmethod
+    def fromItem(cls, item):
+        term = cls(item.get("id", ''))
+        for cs in item["cardSides"]:
+            label = cs["label"]
+            for media in cs["media"]:
+                if "plainText" in media and label in ("word", "definition"):
+                    setattr(term, label, media["plainText"])
+                    setattr(term, label + "TTS", media["ttsUrl"])
+                    setattr(term, label + "RichText", media.get("richText", ""))
+                if media['type'] == 2:
+                    term.imageUrl = media["url"]
+        return term
+
+# turn pages of studiable items into lists of terms as the pages arrive,
+# a page is released as soon as its terms are built
+def iterTermPages(pages):
+    for items in pages:
+        yield [Term.fromItem(item) for item in items]